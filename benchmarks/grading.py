@@ -0,0 +1,92 @@
+"""Compare grading with precompiled answer keys against per-answer normalization.
+
+Usage (from the repository root):
+    python -m benchmarks.grading [--answers 100000]
+
+"submit" grades a 10-question submission the way submit_test used to (the
+correct answer normalized again for every answer) and with
+grading_service.grade_submission. "regrade" runs grading_service.regrade
+over --answers stored answers, as an admin fix of an answer key would.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from services.grading_service import compile_key, grade_submission, regrade
+
+QUESTIONS = 1000
+OPTIONS = [f"Option {i} " for i in range(8)]
+
+
+def make_questions() -> list[dict]:
+    questions = []
+    for qid in range(1, QUESTIONS + 1):
+        qtype = random.choice(['multiple-choice', 'single-choice'])
+        correct = random.sample(OPTIONS, 3 if qtype == 'multiple-choice' else 1)
+        questions.append({
+            "id": qid, "question_type": qtype, "difficulty": random.choice(["easy", "medium", "hard"]),
+            "correct_answer": correct, "answer_key": compile_key(qtype, correct)
+        })
+    return questions
+
+
+def legacy_grade(questions: list[dict], submitted: dict[int, list]) -> int:
+    passed = 0
+    for q in questions:
+        correct_val = q["correct_answer"]
+        user_ans = submitted[q["id"]]
+        if q["question_type"] == 'multiple-choice' and len(correct_val) > 1:
+            is_correct = (sorted(str(c).strip().lower() for c in correct_val)
+                          == sorted(str(a).strip().lower() for a in user_ans))
+        else:
+            is_correct = len(user_ans) == len(correct_val) and all(
+                str(c).strip().lower() == str(a).strip().lower()
+                for c, a in zip(correct_val, user_ans)
+            )
+        passed += is_correct
+    return passed
+
+
+def timeit(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--answers", type=int, default=100_000)
+    args = parser.parse_args()
+    questions = make_questions()
+    by_id = {q["id"]: q for q in questions}
+
+    def answer(q: dict) -> list:
+        chosen = list(q["correct_answer"]) if random.random() < 0.5 else random.sample(OPTIONS, 2)
+        random.shuffle(chosen)
+        return [c.upper() for c in chosen]
+
+    test = random.sample(questions, 10)
+    submitted = {q["id"]: answer(q) for q in test}
+    assert legacy_grade(test, submitted) == grade_submission(test, submitted)["passed"]
+    for name, fn in (("submit: legacy", lambda: legacy_grade(test, submitted)),
+                     ("submit: compiled keys", lambda: grade_submission(test, submitted))):
+        print(f"{name:<24} median {timeit(fn, 2000) * 1e6:8.2f} us")
+
+    stored = []
+    for answer_id in range(args.answers):
+        q = by_id[random.randint(1, QUESTIONS)]
+        stored.append((answer_id, q["id"], answer(q), random.random() < 0.5))
+    keys = {q["id"]: q["answer_key"] for q in questions}
+    start = time.perf_counter()
+    changed = regrade(stored, keys)
+    elapsed = time.perf_counter() - start
+    print(f"regrade: {args.answers} answers in {elapsed * 1e3:.1f} ms "
+          f"({args.answers / elapsed:,.0f}/s), {len(changed)} verdicts changed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Load test comparing the sync (PyMySQL + threadpool) and async (aiomysql) stacks.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test db --requests 2000 --query-ms 20
+    python -m benchmarks.load_test http --url http://localhost:8000/api/leaderboard \
+        --concurrency 1000 --duration 30 [--token ACCESS_TOKEN]
+
+"db" issues the same SELECT SLEEP() through database.execute on a
+40-thread pool (Starlette's default threadpool size) and through
+database.aexecute on the event loop, and reports throughput and latency of
+each. "http" hammers a running server; run it once against a deployment of
+the previous release and once against this one to compare the stacks end
+to end.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+THREADPOOL_SIZE = 40
+
+
+def report(name: str, latencies: list[float], elapsed: float, errors: int = 0) -> None:
+    latencies.sort()
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)] if latencies else 0.0
+    print(f"{name:<6} {len(latencies) / elapsed:10.1f} req/s  "
+          f"p50 {statistics.median(latencies) * 1e3 if latencies else 0:8.2f} ms  "
+          f"p99 {p99 * 1e3:8.2f} ms  errors {errors}")
+
+
+def bench_db(requests: int, query_ms: int) -> None:
+    import database
+    query = "SELECT SLEEP(%s)"
+    params = (query_ms / 1000,)
+
+    def sync_call() -> float:
+        start = time.perf_counter()
+        database.execute(query, params)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(THREADPOOL_SIZE) as executor:
+        start = time.perf_counter()
+        latencies = list(executor.map(lambda _: sync_call(), range(requests)))
+        report("sync", latencies, time.perf_counter() - start)
+
+    async def async_run() -> None:
+        async def call() -> float:
+            begin = time.perf_counter()
+            await database.aexecute(query, params)
+            return time.perf_counter() - begin
+
+        await database.get_async_pool()
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(call() for _ in range(requests)))
+        report("async", list(latencies), time.perf_counter() - start)
+        await database.close_async_pool()
+
+    asyncio.run(async_run())
+
+
+async def bench_http(url: str, concurrency: int, duration: float, token: str | None) -> None:
+    import httpx
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client) -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            begin = time.perf_counter()
+            try:
+                response = await client.get(url, headers=headers)
+                if response.status_code >= 400:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - begin)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        report("http", latencies, time.perf_counter() - start, errors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="mode", required=True)
+    db = sub.add_parser("db")
+    db.add_argument("--requests", type=int, default=2000)
+    db.add_argument("--query-ms", type=int, default=20)
+    http = sub.add_parser("http")
+    http.add_argument("--url", required=True)
+    http.add_argument("--concurrency", type=int, default=1000)
+    http.add_argument("--duration", type=float, default=30)
+    http.add_argument("--token")
+    args = parser.parse_args()
+    if args.mode == "db":
+        bench_db(args.requests, args.query_ms)
+    else:
+        asyncio.run(bench_http(args.url, args.concurrency, args.duration, args.token))
+
+
+if __name__ == "__main__":
+    main()
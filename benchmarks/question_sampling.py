@@ -0,0 +1,97 @@
+"""Compare in-memory question sampling with ORDER BY RAND() in MySQL.
+
+Usage (from the repository root):
+    python -m benchmarks.question_sampling            # in-memory only
+    python -m benchmarks.question_sampling --mysql    # also the SQL path
+
+The SQL path fills a scratch table bench_questions in the database from
+database_user.json and drops it afterwards.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from services.sampling_service import IdPool, sample_pools
+
+SIZES = (10_000, 100_000, 1_000_000)
+TOPICS = 50
+DRAW = 10
+
+
+def timeit(fn, repeat: int) -> tuple[float, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def bench_memory(size: int) -> None:
+    all_ids = IdPool(range(1, size + 1))
+    by_topic = [IdPool() for _ in range(TOPICS)]
+    for qid in range(1, size + 1):
+        by_topic[qid % TOPICS].add(qid)
+    chosen = by_topic[:3]
+    cases = {
+        "pool: any 10": lambda: all_ids.sample(DRAW),
+        "pool: 10 from 3 topics": lambda: sample_pools(chosen, DRAW),
+        "list copy + random.sample": lambda: random.sample(list(all_ids), DRAW),
+    }
+    for name, fn in cases.items():
+        median, p99 = timeit(fn, 200 if size < 1_000_000 else 50)
+        print(f"{size:>9} {name:<28} median {median * 1e6:10.1f} us  p99 {p99 * 1e6:10.1f} us")
+
+
+def bench_mysql(size: int) -> None:
+    import pymysql
+    with open('database_user.json') as file:
+        cfg = json.load(file)
+    conn = pymysql.connect(host=cfg['host'], user=cfg['user'], password=cfg['password'],
+                           database=cfg['database'], autocommit=True)
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS bench_questions")
+    cur.execute(
+        "CREATE TABLE bench_questions (id INT PRIMARY KEY, topic_code VARCHAR(32), "
+        "question_text TEXT, KEY (topic_code))"
+    )
+    try:
+        batch = []
+        for qid in range(1, size + 1):
+            batch.append((qid, f"t{qid % TOPICS}", "x" * 200))
+            if len(batch) == 10_000:
+                cur.executemany("INSERT INTO bench_questions VALUES (%s, %s, %s)", batch)
+                batch = []
+        if batch:
+            cur.executemany("INSERT INTO bench_questions VALUES (%s, %s, %s)", batch)
+        cases = {
+            "sql: ORDER BY RAND()": "SELECT id FROM bench_questions ORDER BY RAND() LIMIT 10",
+            "sql: 3 topics ORDER BY RAND()": (
+                "SELECT id FROM bench_questions WHERE topic_code IN ('t0', 't1', 't2') "
+                "ORDER BY RAND() LIMIT 10"
+            ),
+        }
+        for name, query in cases.items():
+            median, p99 = timeit(lambda: (cur.execute(query), cur.fetchall()), 20)
+            print(f"{size:>9} {name:<28} median {median * 1e6:10.1f} us  p99 {p99 * 1e6:10.1f} us")
+    finally:
+        cur.execute("DROP TABLE IF EXISTS bench_questions")
+        cur.close()
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mysql", action="store_true", help="also benchmark ORDER BY RAND()")
+    args = parser.parse_args()
+    for size in SIZES:
+        bench_memory(size)
+        if args.mysql:
+            bench_mysql(size)
+
+
+if __name__ == "__main__":
+    main()
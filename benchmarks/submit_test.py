@@ -0,0 +1,74 @@
+"""Measure MySQL round trips and latency of tests_service.submit_test.
+
+Usage (from the repository root, against a development database):
+    python -m benchmarks.submit_test --user-id 1 --runs 200
+
+Each run starts a fresh test for the user, answers every question with its
+first option and submits it, so it adds tests, test_answers and score rows
+for that user. Round trips are counted at the aiomysql protocol level and
+pool checkouts at aiomysql.Pool.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+
+import aiomysql
+
+from services import tests_service
+
+counters = {"round_trips": 0, "checkouts": 0}
+
+
+def _count_round_trips():
+    original = aiomysql.Connection._execute_command
+
+    async def counted(self, command, sql):
+        counters["round_trips"] += 1
+        return await original(self, command, sql)
+
+    aiomysql.Connection._execute_command = counted
+
+
+def _count_checkouts():
+    original = aiomysql.Pool._acquire
+
+    async def counted(self):
+        counters["checkouts"] += 1
+        return await original(self)
+
+    aiomysql.Pool._acquire = counted
+
+
+async def run() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+    _count_round_trips()
+    _count_checkouts()
+    latencies, trips, checkouts = [], [], []
+    for _ in range(args.runs):
+        test_id = await tests_service.start_test(args.user_id, "FI", [])
+        questions = (await tests_service.get_test_questions(args.user_id, test_id))["questions"]
+        answers = [
+            SimpleNamespace(question_id=q["id"], answer=q["options"][:1])
+            for q in questions
+        ]
+        counters.update(round_trips=0, checkouts=0)
+        start = time.perf_counter()
+        await tests_service.submit_test(args.user_id, test_id, answers)
+        latencies.append(time.perf_counter() - start)
+        trips.append(counters["round_trips"])
+        checkouts.append(counters["checkouts"])
+    latencies.sort()
+    print(f"runs: {args.runs}")
+    print(f"round trips per submit: {statistics.median(trips)}")
+    print(f"pool checkouts per submit: {statistics.median(checkouts)}")
+    print(f"latency p50: {statistics.median(latencies) * 1e3:.2f} ms")
+    print(f"latency p99: {latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
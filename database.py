@@ -1,7 +1,12 @@
 import pymysql
+import aiomysql
+import asyncio
 import json
+import os
+from contextlib import contextmanager, asynccontextmanager
 from dbutils.pooled_db import PooledDB
 import redis
+import redis.asyncio as aioredis
 
 # new database module for shared DB pool and Redis client
 with open('database_user.json') as file:
@@ -18,14 +23,173 @@ pool = PooledDB(
     maxcached=20,
 )
 
-redis_client = redis.Redis()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "100"))
 
+redis_client = redis.Redis.from_url(REDIS_URL)
+# waits for a free connection instead of failing once the pool is exhausted
+async_redis = aioredis.Redis(
+    connection_pool=aioredis.BlockingConnectionPool.from_url(
+        REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+)
 
-def execute(query: str, params: tuple = None, fetchone: bool = False):
+
+class Session:
+    """Runs a group of queries on one pooled connection and cursor"""
+
+    def __init__(self, conn, cur):
+        self.conn = conn
+        self.cursor = cur
+
+    def execute(self, query: str, params: tuple = None, fetchone: bool = False):
+        self.cursor.execute(query, params or ())
+        return self.cursor.fetchone() if fetchone else self.cursor.fetchall()
+
+    def executemany(self, query: str, seq_params: list[tuple]) -> int:
+        if not seq_params:
+            return 0
+        return self.cursor.executemany(query, seq_params)
+
+    def insert(self, query: str, params: tuple = None) -> int:
+        """Run an INSERT and return the generated id"""
+        self.cursor.execute(query, params or ())
+        return self.cursor.lastrowid
+
+    @property
+    def lastrowid(self) -> int:
+        return self.cursor.lastrowid
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+
+@contextmanager
+def session(atomic: bool = False):
+    """Yield a Session; with atomic=True its queries form one transaction"""
     conn = pool.connection()
     cur = conn.cursor()
-    cur.execute(query, params or ())
-    result = cur.fetchone() if fetchone else cur.fetchall()
-    cur.close()
-    conn.close()
-    return result
+    try:
+        if atomic:
+            conn.begin()
+        yield Session(conn, cur)
+        if atomic:
+            conn.commit()
+    except BaseException:
+        if atomic:
+            conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def transaction():
+    return session(atomic=True)
+
+
+def execute(query: str, params: tuple = None, fetchone: bool = False):
+    with session() as db:
+        return db.execute(query, params, fetchone)
+
+
+def insert(query: str, params: tuple = None) -> int:
+    with session() as db:
+        return db.insert(query, params)
+
+
+# asyncio counterpart of the pool above, created on first use inside the
+# running event loop
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+
+
+async def get_async_pool():
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                _async_pool = await aiomysql.create_pool(
+                    host=_cfg['host'],
+                    user=_cfg['user'],
+                    password=_cfg['password'],
+                    db=_cfg['database'],
+                    autocommit=True,
+                    minsize=5,
+                    maxsize=_cfg.get('async_pool_size', 50),
+                )
+    return _async_pool
+
+
+async def close_async_pool() -> None:
+    global _async_pool
+    if _async_pool is not None:
+        _async_pool.close()
+        await _async_pool.wait_closed()
+        _async_pool = None
+
+
+class AsyncSession:
+    """Async Session running a group of queries on one aiomysql connection"""
+
+    def __init__(self, conn, cur):
+        self.conn = conn
+        self.cursor = cur
+
+    async def execute(self, query: str, params: tuple = None, fetchone: bool = False):
+        await self.cursor.execute(query, params or ())
+        return await self.cursor.fetchone() if fetchone else await self.cursor.fetchall()
+
+    async def executemany(self, query: str, seq_params: list[tuple]) -> int:
+        if not seq_params:
+            return 0
+        return await self.cursor.executemany(query, seq_params)
+
+    async def insert(self, query: str, params: tuple = None) -> int:
+        """Run an INSERT and return the generated id"""
+        await self.cursor.execute(query, params or ())
+        return self.cursor.lastrowid
+
+    @property
+    def lastrowid(self) -> int:
+        return self.cursor.lastrowid
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+
+@asynccontextmanager
+async def asession(atomic: bool = False):
+    """Yield an AsyncSession; with atomic=True its queries form one transaction"""
+    apool = await get_async_pool()
+    async with apool.acquire() as conn:
+        async with conn.cursor() as cur:
+            if atomic:
+                await conn.begin()
+            try:
+                yield AsyncSession(conn, cur)
+                if atomic:
+                    await conn.commit()
+            except BaseException:
+                if atomic:
+                    await conn.rollback()
+                raise
+
+
+def atransaction():
+    return asession(atomic=True)
+
+
+async def aexecute(query: str, params: tuple = None, fetchone: bool = False):
+    async with asession() as db:
+        return await db.execute(query, params, fetchone)
+
+
+async def ainsert(query: str, params: tuple = None) -> int:
+    async with asession() as db:
+        return await db.insert(query, params)
+
+
+async def close_async_redis() -> None:
+    await async_redis.aclose()
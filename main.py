@@ -6,13 +6,40 @@ from routers.leaderboard_router import router as leaderboard_router
 from routers.user_router import router as user_router
 from routers.auth_router import router as auth_router
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from database import close_async_pool, close_async_redis
+from services import write_behind_service
+from services.password_service import shutdown_pool
+from services.user_service import user_scope
+from services.stats_service import check_stats_table
+from services import question_bank, topic_service
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.staticfiles import StaticFiles
+import asyncio
 import os
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await check_stats_table()
+    # load the in-process caches here rather than inline in the first requests
+    await asyncio.to_thread(question_bank.preload)
+    await asyncio.to_thread(topic_service.preload)
+    writer = asyncio.create_task(write_behind_service.run_worker())
+    yield
+    writer.cancel()
+    try:
+        await writer
+    except asyncio.CancelledError:
+        pass
+    await write_behind_service.drain()
+    shutdown_pool()
+    await close_async_pool()
+    await close_async_redis()
+
+
+app = FastAPI(lifespan=lifespan)
 # Add session middleware for OAuthlib
 app.add_middleware(
     SessionMiddleware,
@@ -27,6 +54,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+class UserScopeMiddleware:
+    """Memoize user lookups for the duration of each HTTP request.
+
+    A plain ASGI middleware: BaseHTTPMiddleware would add a task and a
+    memory stream to every request just to set a ContextVar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with user_scope():
+            await self.app(scope, receive, send)
+
+
+app.add_middleware(UserScopeMiddleware)
+
+
 os.makedirs("uploads", exist_ok=True)
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
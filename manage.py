@@ -0,0 +1,148 @@
+"""Maintenance commands, run from the repository root: python manage.py <command>"""
+import argparse
+import time
+
+
+def rebuild_leaderboard(args) -> None:
+    from services.leaderboard_service import rebuild_leaderboard
+    counts = rebuild_leaderboard()
+    for section, count in counts.items():
+        print(f"{section}: {count} users")
+
+
+def reload_topics(args) -> None:
+    from services.topic_service import bump_version
+    print(f"topics version: {bump_version()}")
+
+
+def drain_writes(args) -> None:
+    import asyncio
+    from database import close_async_pool, close_async_redis
+    from services.write_behind_service import drain
+
+    async def run() -> int:
+        try:
+            return await drain()
+        finally:
+            await close_async_pool()
+            await close_async_redis()
+
+    print(f"applied {asyncio.run(run())} queued submissions")
+
+
+def replay_dead_letters(args) -> None:
+    import asyncio
+    from database import close_async_pool, close_async_redis
+    from services.write_behind_service import list_dead_letters, replay_dead_letters
+
+    async def run() -> None:
+        try:
+            if args.list:
+                for entry_id, submission, error in await list_dead_letters(args.count):
+                    print(f"{entry_id}: test {submission['test_id']}, "
+                          f"user {submission['user_id']}: {error}")
+                return
+            print(f"queued {await replay_dead_letters(args.entry_ids or None)} submissions again")
+        finally:
+            await close_async_pool()
+            await close_async_redis()
+
+    asyncio.run(run())
+
+
+def regrade(args) -> None:
+    from services.regrade_service import run_regrade, run_pending_regrades, schedule_regrade
+
+    def report(job: dict) -> None:
+        print(f"question {job['question_id']}: {job['processed']}/{job['total']} answers, "
+              f"{job['changed']} verdicts changed")
+
+    options = {"chunk_size": args.chunk_size, "pause": args.pause, "progress": report}
+    if args.watch:
+        while True:
+            run_pending_regrades(**options)
+            time.sleep(args.interval)
+    if not args.question_ids:
+        run_pending_regrades(**options)
+        return
+    for question_id in args.question_ids:
+        if args.restart:
+            schedule_regrade(question_id)
+        if run_regrade(question_id, **options) is None:
+            print(f"question {question_id}: already being regraded elsewhere")
+
+
+def reload_admins(args) -> None:
+    from services.admin_service import invalidate_admins
+    print(f"admins version: {invalidate_admins()}")
+
+
+def rebuild_stats(args) -> None:
+    from services.stats_service import rebuild_user_stats, stats_table_exists
+    if args.if_missing and stats_table_exists():
+        print("user_stats: already exists")
+        return
+    print(f"user_stats: {rebuild_user_stats()} users")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser(
+        "rebuild-leaderboard",
+        help="reload the leaderboard sorted sets from MySQL"
+    ).set_defaults(func=rebuild_leaderboard)
+    stats_parser = commands.add_parser(
+        "rebuild-stats",
+        help="create user_stats if needed and recompute it from the tests table"
+    )
+    stats_parser.add_argument("--if-missing", action="store_true",
+                              help="do nothing when the table already exists (used by run.sh)")
+    stats_parser.set_defaults(func=rebuild_stats)
+    commands.add_parser(
+        "reload-topics",
+        help="make every worker reload the topics table after editing it"
+    ).set_defaults(func=reload_topics)
+    commands.add_parser(
+        "reload-admins",
+        help="make every worker re-read the admins table after editing it"
+    ).set_defaults(func=reload_admins)
+    commands.add_parser(
+        "drain-writes",
+        help="apply every queued test submission to MySQL, e.g. before shutdown"
+    ).set_defaults(func=drain_writes)
+    replay_parser = commands.add_parser(
+        "replay-dead-letters",
+        help="queue dead-lettered test submissions again once the cause is fixed"
+    )
+    replay_parser.add_argument("entry_ids", nargs="*",
+                               help="dead-letter entry ids to replay (default: all)")
+    replay_parser.add_argument("--list", action="store_true",
+                               help="only print the dead-lettered submissions and their errors")
+    replay_parser.add_argument("--count", type=int, default=100,
+                               help="how many entries --list prints")
+    replay_parser.set_defaults(func=replay_dead_letters)
+    regrade_parser = commands.add_parser(
+        "regrade",
+        help="regrade stored answers after answer key changes; resumes interrupted jobs"
+    )
+    regrade_parser.add_argument(
+        "question_ids", nargs="*", type=int,
+        help="questions to regrade (default: every pending job)"
+    )
+    regrade_parser.add_argument("--restart", action="store_true",
+                                help="start the given questions over from their first answer")
+    regrade_parser.add_argument("--chunk-size", type=int, default=1000)
+    regrade_parser.add_argument("--pause", type=float, default=0.0,
+                                help="seconds to sleep between chunks")
+    regrade_parser.add_argument("--watch", action="store_true",
+                                help="keep running, picking up jobs scheduled by question edits")
+    regrade_parser.add_argument("--interval", type=float, default=5.0,
+                                help="seconds between checks for new jobs with --watch")
+    regrade_parser.set_defaults(func=regrade)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
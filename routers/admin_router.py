@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from typing import List, Optional
 from services.admin_service import (
@@ -8,34 +8,14 @@ from services.admin_service import (
     get_settings, add_proposed_question, update_proposed_question,
     is_user_admin, get_questions_feedback
 )
+from services.password_service import password_metrics
+from services.regrade_service import regrade_status
 from datetime import datetime
+from security import current_user
 
 
-def admin_required(
-    authorization: str = Header(None, alias="Authorization")
-) -> None:
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"code": "missing_token"}
-        )
-    token = authorization.split(" ", 1)[1]
-    from security import decode_access_token
-    from jwt import ExpiredSignatureError, InvalidTokenError
-    try:
-        payload = decode_access_token(token)
-    except ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"code": "token_expired"}
-        )
-    except InvalidTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"code": "invalid_token"}
-        )
-    user_id = payload.get("user_id")
-    if not user_id or not is_user_admin(user_id):
+def admin_required(user: dict = Depends(current_user)) -> None:
+    if not is_user_admin(user["id"]):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail={"code": "not_admin"}
@@ -83,18 +63,20 @@ class FeedbackOut(BaseModel):
     created_at: datetime
 
 
-@router.get('/questions', response_model=List[QuestionOut], dependencies=[Depends(admin_required)])
+@router.get('/questions', response_model=List[QuestionOut])
 def list_questions():
     return get_current_questions()
 
 
-@router.post('/questions', response_model=QuestionOut, status_code=201, dependencies=[Depends(admin_required)])
+@router.post('/questions', response_model=QuestionOut, status_code=201)
 def create_question(q: QuestionIn):
     return add_question(q)
 
 
-@router.put('/questions/{question_id}', response_model=QuestionOut, dependencies=[Depends(admin_required)])
+@router.put('/questions/{question_id}', response_model=QuestionOut)
 def edit_question(question_id: int, q: QuestionIn):
+    """Update a question; a key change only schedules its regrade, which
+    'manage.py regrade --watch' carries out outside the web workers"""
     updated = update_question(question_id, q)
     if not updated:
         raise HTTPException(
@@ -103,7 +85,16 @@ def edit_question(question_id: int, q: QuestionIn):
     return updated
 
 
-@router.delete('/questions/{question_id}', status_code=204, dependencies=[Depends(admin_required)])
+@router.get('/regrade/{question_id}')
+def get_regrade_status(question_id: int):
+    """Progress of the regrade started by the last answer key change of a question"""
+    job = regrade_status(question_id)
+    if not job:
+        raise HTTPException(status_code=404, detail={'code': 'regrade_not_found'})
+    return job
+
+
+@router.delete('/questions/{question_id}', status_code=204)
 def remove_question(question_id: int):
     success = delete_question(question_id)
     if not success:
@@ -112,17 +103,17 @@ def remove_question(question_id: int):
                 'code': 'question_not_found'})
 
 
-@router.get('/proposed', response_model=List[QuestionOut], dependencies=[Depends(admin_required)])
+@router.get('/proposed', response_model=List[QuestionOut])
 def list_proposed():
     return get_proposed_questions()
 
 
-@router.post('/proposed', response_model=QuestionOut, status_code=201, dependencies=[Depends(admin_required)])
+@router.post('/proposed', response_model=QuestionOut, status_code=201)
 def create_proposed(q: QuestionIn):
     return add_proposed_question(q)
 
 
-@router.put('/proposed/{question_id}', response_model=QuestionOut, dependencies=[Depends(admin_required)])
+@router.put('/proposed/{question_id}', response_model=QuestionOut)
 def edit_proposed(question_id: int, q: QuestionIn):
     updated = update_proposed_question(question_id, q)
     if not updated:
@@ -132,7 +123,7 @@ def edit_proposed(question_id: int, q: QuestionIn):
     return updated
 
 
-@router.post('/proposed/{question_id}/approve', response_model=QuestionOut, dependencies=[Depends(admin_required)])
+@router.post('/proposed/{question_id}/approve', response_model=QuestionOut)
 def approve(question_id: int):
     approved = approve_proposed_question(question_id)
     if not approved:
@@ -142,7 +133,7 @@ def approve(question_id: int):
     return approved
 
 
-@router.post('/proposed/{question_id}/reject', status_code=204, dependencies=[Depends(admin_required)])
+@router.post('/proposed/{question_id}/reject', status_code=204)
 def reject(question_id: int):
     success = reject_proposed_question(question_id)
     if not success:
@@ -151,11 +142,17 @@ def reject(question_id: int):
                 'code': 'proposal_not_found'})
 
 
-@router.get('/settings', response_model=SettingsOut, dependencies=[Depends(admin_required)])
+@router.get('/settings', response_model=SettingsOut)
 def settings():
     return get_settings()
 
 
-@router.get('/feedback', response_model=List[FeedbackOut], dependencies=[Depends(admin_required)])
+@router.get('/metrics/passwords')
+def password_pool_metrics():
+    """Counters and queue depth of the bcrypt process pool in this worker"""
+    return password_metrics()
+
+
+@router.get('/feedback', response_model=List[FeedbackOut])
 def list_feedback():
     return get_questions_feedback()
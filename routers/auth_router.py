@@ -1,7 +1,8 @@
 from services.achievement_service import check_and_award
-from services.user_service import save_user, change_db_users, get_user_by_email, \
-    delete_user_by_id, get_user_by_telegram, set_refresh_token
-from fastapi import APIRouter, HTTPException, BackgroundTasks, File, Form, UploadFile, Header, status
+from services.user_service import save_user, change_db_users, update_user, get_user_by_email, \
+    delete_user_by_id, get_user_by_telegram, set_refresh_token, set_password_hash
+from services.password_service import verify_password
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, File, Form, UploadFile, status
 from pydantic import BaseModel, EmailStr
 from enum import Enum
 import random
@@ -9,8 +10,7 @@ import os
 import uuid
 import secrets
 import re
-from security import create_access_token, decode_access_token, verify_password
-from jwt import ExpiredSignatureError, InvalidTokenError
+from security import create_access_token, current_user
 from services.email_service import send_verification_email
 from typing import Optional
 
@@ -119,15 +119,18 @@ class LinkTelegramRequest(BaseModel):
 # Endpoints
 @router.post('/login')
 def login(data: LoginRequest, background_tasks: BackgroundTasks):
-    user = get_user_by_email(data.email)
+    user = get_user_by_email(data.email, credentials=True)
     if not user:
         raise HTTPException(
             status_code=404, detail={
                 'code': ErrorCodes.USER_NOT_FOUND})
-    if not verify_password(data.password, user['password']):
+    valid, new_hash = verify_password(data.password, user['password'])
+    if not valid:
         raise HTTPException(
             status_code=401, detail={
                 'code': ErrorCodes.INVALID_CREDENTIALS})
+    if new_hash:
+        set_password_hash(user['id'], new_hash)
     if not user['verified']:
         code = generate_verification_code()
         if change_db_users(
@@ -194,7 +197,7 @@ def register(data: RegisterRequest, background_tasks: BackgroundTasks):
 
 @router.post('/verify')
 def verify(data: VerifyRequest):
-    user = get_user_by_email(data.email)
+    user = get_user_by_email(data.email, credentials=True)
     if not user:
         raise HTTPException(
             status_code=404, detail={
@@ -232,7 +235,7 @@ def recover(data: RecoverRequest):
 
 @router.post('/recover/verify')
 def recover_verify(data: RecoverVerifyRequest):
-    user = get_user_by_email(data.email)
+    user = get_user_by_email(data.email, credentials=True)
     if not user:
         raise HTTPException(
             status_code=404, detail={
@@ -246,7 +249,7 @@ def recover_verify(data: RecoverVerifyRequest):
 
 @router.post('/recover/change')
 def recover_change_password(data: ChangePasswordRequest):
-    user = get_user_by_email(data.email)
+    user = get_user_by_email(data.email, credentials=True)
     if not user:
         raise HTTPException(
             status_code=404, detail={
@@ -297,23 +300,14 @@ class UpdatePasswordRequest(BaseModel):
 
 
 @router.post('/change-password')
-async def change_password(data: UpdatePasswordRequest,
-                          authorization: str = Header(None, alias="Authorization")):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail={"code": "missing_token"})
-    token = authorization.split(" ", 1)[1]
-    try:
-        payload = decode_access_token(token)
-    except ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail={"code": "token_expired"})
-    except InvalidTokenError:
-        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
-    user = get_user_by_email(payload.get("sub"))
+def change_password(data: UpdatePasswordRequest, current: dict = Depends(current_user)):
+    user = get_user_by_email(current["email"], credentials=True)
     if not user:
         raise HTTPException(
             status_code=404, detail={
                 "code": ErrorCodes.USER_NOT_FOUND})
-    if not verify_password(data.oldPassword, user['password']):
+    valid, _ = verify_password(data.oldPassword, user['password'])
+    if not valid:
         raise HTTPException(
             status_code=400, detail={
                 "code": ErrorCodes.INVALID_CREDENTIALS})
@@ -326,7 +320,7 @@ async def change_password(data: UpdatePasswordRequest,
 
 
 @router.patch('/update-profile')
-async def update_profile(
+def update_profile(
     username: str = Form(None),
     email: str = Form(None),
     telegram: str = Form(None),
@@ -335,20 +329,11 @@ async def update_profile(
     bio: str = Form(None),
     removeAvatar: str = Form(None),
     avatar: UploadFile = File(None),
-    authorization: str = Header(None, alias="Authorization")
+    current: dict = Depends(current_user)
 ):
     print(username, email, telegram, github, website, bio)
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail={"code": "missing_token"})
-    token = authorization.split(" ", 1)[1]
-    try:
-        payload = decode_access_token(token)
-    except ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail={"code": "token_expired"})
-    except InvalidTokenError:
-        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
-    user_id = payload.get('user_id')
-    current_email = payload.get('sub')
+    user_id = current['id']
+    current_email = current['email']
     user = get_user_by_email(current_email)
     if username is not None and len(username) > MAX_USERNAME_LEN:
         raise HTTPException(
@@ -384,6 +369,7 @@ async def update_profile(
         raise HTTPException(
             status_code=400, detail={
                 'code': ErrorCodes.BIO_LENGTH_INVALID})
+    changes = {}
     if removeAvatar == "true":
         path = user.get("avatar", "")
         if path.startswith("/uploads/"):
@@ -391,10 +377,10 @@ async def update_profile(
             file_path = os.path.join("uploads", filename)
             if os.path.exists(file_path):
                 os.remove(file_path)
-        change_db_users(current_email, ('avatar', ''))
+        changes['avatar'] = ''
 
     if avatar:
-        data = await avatar.read()
+        data = avatar.file.read()
         if len(data) > MAX_AVATAR_SIZE:
             raise HTTPException(
                 status_code=400, detail={
@@ -405,35 +391,23 @@ async def update_profile(
         file_path = os.path.join('uploads', filename)
         with open(file_path, "wb") as f:
             f.write(data)
-        change_db_users(current_email, ('avatar', f"/uploads/{filename}"))
+        changes['avatar'] = f"/uploads/{filename}"
     new_email = current_email
     if email and email != current_email:
-        change_db_users(current_email, ('email', email))
+        changes['email'] = email
         new_email = email
     for col, val in [('username', username), ('telegram', telegram),
                      ('github', github), ('website', website), ('bio', bio)]:
         if val is not None:
-            change_db_users(new_email, (col, val))
+            changes[col] = val
+    update_user(current_email, changes)
     new_token = create_access_token({"sub": new_email, "user_id": user_id})
     return {"token": new_token}
 
 
 @router.delete('/delete-account')
-async def delete_account(
-        authorization: str = Header(None, alias="Authorization")):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail={"code": "missing_token"})
-    token = authorization.split(" ", 1)[1]
-    try:
-        payload = decode_access_token(token)
-    except ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail={"code": "token_expired"})
-    except InvalidTokenError:
-        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
-    user_id = payload.get('user_id')
-    if not user_id:
-        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
-    deleted = delete_user_by_id(user_id)
+def delete_account(current: dict = Depends(current_user)):
+    deleted = delete_user_by_id(current['id'])
     if not deleted:
         raise HTTPException(status_code=500, detail={"code": "delete_failed"})
     return {"message": "account_deleted"}
@@ -485,15 +459,18 @@ def login_telegram(data: LoginTelegramRequest,
 
 @router.post('/link-telegram')
 def link_telegram(data: LinkTelegramRequest):
-    user = get_user_by_email(data.email)
+    user = get_user_by_email(data.email, credentials=True)
     if not user:
         raise HTTPException(
             status_code=404, detail={
                 'code': ErrorCodes.USER_NOT_FOUND})
-    if not verify_password(data.password, user['password']):
+    valid, new_hash = verify_password(data.password, user['password'])
+    if not valid:
         raise HTTPException(
             status_code=401, detail={
                 'code': ErrorCodes.INVALID_CREDENTIALS})
+    if new_hash:
+        set_password_hash(user['id'], new_hash)
     if change_db_users(data.email, ('telegram',
                        data.telegram_username)) != 'success':
         raise HTTPException(
@@ -1,19 +1,42 @@
-from fastapi import APIRouter, BackgroundTasks
-from fastapi.concurrency import run_in_threadpool
-from services.leaderboard_service import get_leaderboard
-from services.achievement_service import check_and_award
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from services.leaderboard_service import (
+    get_leaderboard_snapshot, get_leaderboard_page, get_user_standing, SECTIONS, MAX_PAGE_SIZE, MAX_NEIGHBOURS
+)
+from services.user_service import get_user_by_username_async
 
 router = APIRouter()
 
 
 @router.get("/leaderboard")
-async def leaderboard(background_tasks: BackgroundTasks):
-    """Returns the fundamentals and algorithms leaderboards and awards top‑3 badges asynchronously."""
-    data = await run_in_threadpool(get_leaderboard)
-    for category in ('fundamentals', 'algorithms'):
-        for entry in data.get(category, [])[:3]:
-            user_id = entry.get('user_id')
-            if user_id:
-                background_tasks.add_task(
-                    check_and_award, user_id, 'leaderboard_top3')
-    return data
+async def leaderboard(request: Request):
+    """Returns the fundamentals and algorithms leaderboards as pre-encoded JSON, honouring If-None-Match."""
+    snapshot = await get_leaderboard_snapshot()
+    gzipped = "gzip" in request.headers.get("accept-encoding", "")
+    etag = snapshot['gzip_etag'] if gzipped else snapshot['etag']
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(snapshot['gzip'], media_type="application/json", headers=headers)
+    return Response(snapshot['body'], media_type="application/json", headers=headers)
+
+
+@router.get("/leaderboard/rank/{username}")
+async def leaderboard_rank(username: str, neighbours: int = Query(5, ge=0, le=MAX_NEIGHBOURS)):
+    """Returns a user's rank, percentile and nearby users in each leaderboard."""
+    user = await get_user_by_username_async(username)
+    if not user:
+        raise HTTPException(status_code=404, detail={"code": "user_not_found"})
+    standings = await get_user_standing(user['id'], neighbours)
+    return {'username': user['username'], **standings}
+
+
+@router.get("/leaderboard/{section}")
+async def leaderboard_page(section: str, offset: int = Query(0, ge=0),
+                           limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE)):
+    """Returns one page of the fundamentals or algorithms leaderboard."""
+    if section not in SECTIONS:
+        raise HTTPException(status_code=404, detail={"code": "section_not_found"})
+    return await get_leaderboard_page(section, offset, limit)
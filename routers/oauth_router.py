@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Request, HTTPException
 from starlette.responses import RedirectResponse
+import asyncio
 import os
 from authlib.integrations.starlette_client import OAuth
 from services.user_service import get_user_by_email, save_user
@@ -29,6 +30,14 @@ oauth.register(
 auth_frontend = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
 
+def _get_or_create_user(email: str, username: str) -> dict:
+    user = get_user_by_email(email)
+    if not user:
+        save_user(email, "", username, True, "")
+        user = get_user_by_email(email)
+    return user
+
+
 @router.get("/{provider}/login")
 async def oauth_login(provider: str, request: Request):
     if provider not in ("github", "google"):
@@ -70,10 +79,8 @@ async def oauth_callback(provider: str, request: Request):
             userinfo = resp.json()
         email = userinfo.get("email")
         username = userinfo.get("name") or email.split("@")[0]
-    user = get_user_by_email(email)
-    if not user:
-        save_user(email, "", username, True, "")
-        user = get_user_by_email(email)
+    # save_user hashes a password and both touch MySQL: keep them off the event loop
+    user = await asyncio.to_thread(_get_or_create_user, email, username)
     access_token = create_access_token({"sub": email, "user_id": user["id"]})
     redirect_url = f"{auth_frontend}/callback?token={access_token}"
     return RedirectResponse(redirect_url)
@@ -1,10 +1,9 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from typing import List, Optional
 import datetime
 
-from security import decode_access_token
-from jwt import ExpiredSignatureError, InvalidTokenError
+from security import current_user
 from services.tests_service import start_test, get_test_questions, submit_test, get_test_answers, save_question_feedback
 
 router = APIRouter()
@@ -80,60 +79,42 @@ class FeedbackIn(BaseModel):
     feedback_message: Optional[str] = None
 
 
-# Authorization helper
-def authorize(authorization: str) -> int:
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail={"code": "missing_token"})
-    token = authorization.split(" ", 1)[1]
-    try:
-        payload = decode_access_token(token)
-    except ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail={"code": "token_expired"})
-    except InvalidTokenError:
-        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
-    return user_id
-
-
 # Routes
 @router.post("/", response_model=TestStartOut, status_code=201)
-def start_test_route(body: TestStartIn, authorization: str = Header(
-        None, alias="Authorization")):
-    user_id = authorize(authorization)
-    test_id = start_test(user_id, body.section, body.topics)
+async def start_test_route(body: TestStartIn, user: dict = Depends(current_user)):
+    user_id = user["id"]
+    test_id = await start_test(user_id, body.section, body.topics)
     return {"id": test_id}
 
 
 @router.get("/{test_id}", response_model=QuestionsWithEndOut)
-def get_test_questions_route(
-        test_id: int, authorization: str = Header(None, alias="Authorization")):
-    user_id = authorize(authorization)
-    return get_test_questions(user_id, test_id)
+async def get_test_questions_route(
+        test_id: int, user: dict = Depends(current_user)):
+    user_id = user["id"]
+    return await get_test_questions(user_id, test_id)
 
 
 @router.post("/{test_id}/submit", response_model=TestResult)
-def submit_test_route(test_id: int, body: TestSubmissionIn,
-                      authorization: str = Header(None, alias="Authorization")):
-    user_id = authorize(authorization)
-    return submit_test(user_id, test_id, body.answers)
+async def submit_test_route(test_id: int, body: TestSubmissionIn,
+                            user: dict = Depends(current_user)):
+    user_id = user["id"]
+    return await submit_test(user_id, test_id, body.answers)
 
 
 @router.get("/{test_id}/answers", response_model=TestAnswersOut)
-def get_test_answers_route(
-        test_id: int, authorization: str = Header(None, alias="Authorization")):
-    user_id = authorize(authorization)
-    return get_test_answers(user_id, test_id)
+async def get_test_answers_route(
+        test_id: int, user: dict = Depends(current_user)):
+    user_id = user["id"]
+    return await get_test_answers(user_id, test_id)
 
 
 @router.post("/{test_id}/feedback", status_code=201)
-def submit_feedback_route(
+async def submit_feedback_route(
         test_id: int,
         body: FeedbackIn,
-        authorization: str = Header(None, alias="Authorization")):
-    user_id = authorize(authorization)
-    save_question_feedback(
+        user: dict = Depends(current_user)):
+    user_id = user["id"]
+    await save_question_feedback(
         user_id,
         test_id,
         body.question_id,
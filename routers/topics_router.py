@@ -1,51 +1,16 @@
-from fastapi import APIRouter
-from database import execute
+from fastapi import APIRouter, HTTPException, Request, Response
+from services.topic_service import topic_tree
 
 router = APIRouter()
 
 
-def collect_leaf_labels(topics, parent_id):
-    children = [t for t in topics if t['parent_id'] == parent_id]
-    if not children:
-        parent = next((t for t in topics if t['id'] == parent_id), None)
-        return [parent['label']] if parent else []
-    leafs = []
-    for child in children:
-        leafs.extend(collect_leaf_labels(topics, child['id']))
-    return leafs
-
-
-def build_tree(topics, parent_id):
-    children = [t for t in topics if t['parent_id'] == parent_id]
-    result = []
-    for child in children:
-        grandchildren = [t for t in topics if t['parent_id'] == child['id']]
-        if grandchildren:
-            result.append({
-                "label": child['label'],
-                "accordions": build_tree(topics, child['id'])
-            })
-        else:
-            result.append(child['label'])
-    return result
-
-
 @router.get('/topics')
-def get_topics():
-    rows = execute("SELECT id, label, code, section, parent_id FROM topics")
-    topics = [dict(zip(['id', 'label', 'code', 'section', 'parent_id'], row))
-              for row in rows]
-    section_map = {}
-    for t in topics:
-        section = t['section']
-        if section not in section_map:
-            section_map[section] = []
-        section_map[section].append(t)
-    result = []
-    for section, items in section_map.items():
-        accordions = build_tree(items, None)
-        result.append({
-            "label": section,
-            "accordions": accordions
-        })
-    return result
+def get_topics(request: Request, section: str | None = None):
+    tree = topic_tree(section)
+    if tree is None:
+        raise HTTPException(status_code=404, detail={"code": "section_not_found"})
+    headers = {"ETag": tree['etag'], "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if tree['etag'] in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(tree['body'], media_type="application/json", headers=headers)
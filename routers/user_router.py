@@ -1,13 +1,14 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from services.user_service import get_user_by_email, get_user_by_username, get_user_tests, get_user_scores
-from services.user_service import get_user_by_id
-from services.achievement_service import get_user_achievements
-from security import decode_access_token
-from jwt import ExpiredSignatureError, InvalidTokenError
+from services.user_service import get_user_by_email
+from services.topic_service import random_topic_labels
+from services.user_service import get_user_by_id_async, get_user_by_username_async
+from services.user_service import get_user_tests_async
+from services.stats_service import get_user_stats_async
+from services.achievement_service import get_user_achievements_async
+from security import current_user
 from typing import List, Optional
 import datetime
-from database import execute
 from services.admin_service import is_user_admin
 
 router = APIRouter()
@@ -96,8 +97,8 @@ class QuestionsWithEndOut(BaseModel):
 
 
 @router.get('/user/{username}', response_model=ProfileUserOut)
-def get_profile_by_username(username: str):
-    user = get_user_by_username(username)
+async def get_profile_by_username(username: str):
+    user = await get_user_by_username_async(username)
     if not user:
         raise HTTPException(status_code=404, detail={"code": "user_not_found"})
     return {
@@ -112,9 +113,9 @@ def get_profile_by_username(username: str):
 
 
 @router.get('/user', response_model=ProfileUserOut)
-def get_profile_by_id(id: int):
+async def get_profile_by_id(id: int):
     """Return user profile by numeric ID via query param ?id=…"""
-    user = get_user_by_id(id)
+    user = await get_user_by_id_async(id)
     if not user:
         raise HTTPException(status_code=404, detail={"code": "user_not_found"})
     return {
@@ -129,23 +130,8 @@ def get_profile_by_id(id: int):
 
 
 @router.get("/me", response_model=UserOut)
-def me(authorization: str = Header(None, alias="Authorization")):
-    if (authorization and authorization.startswith("Bearer ")):
-        token = authorization.split(" ", 1)[1]
-    else:
-        raise HTTPException(status_code=401, detail={"code": "missing_token"})
-    try:
-        payload = decode_access_token(token)
-    except ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail={"code": "token_expired"})
-    except InvalidTokenError:
-        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
-
-    email = payload.get("sub")
-    if not email:
-        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
-
-    user = get_user_by_email(email)
+def me(current: dict = Depends(current_user)):
+    user = get_user_by_email(current["email"])
     if not user:
         raise HTTPException(status_code=404, detail={"code": "user_not_found"})
 
@@ -155,22 +141,8 @@ def me(authorization: str = Header(None, alias="Authorization")):
 
 
 @router.get("/me/is_admin")
-def check_is_admin(authorization: str = Header(None, alias="Authorization")):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail={"code": "missing_token"})
-    token = authorization.split(" ", 1)[1]
-    from security import decode_access_token
-    from jwt import ExpiredSignatureError, InvalidTokenError
-    try:
-        payload = decode_access_token(token)
-    except ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail={"code": "token_expired"})
-    except InvalidTokenError:
-        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
-    is_admin = is_user_admin(user_id)
+def check_is_admin(current: dict = Depends(current_user)):
+    is_admin = is_user_admin(current["id"])
     if not is_admin:
         raise HTTPException(status_code=403, detail={"code": "forbidden"})
     return {"is_admin": True}
@@ -178,8 +150,8 @@ def check_is_admin(authorization: str = Header(None, alias="Authorization")):
 
 @router.get("/users/{user_id}/achievements",
             response_model=List[AchievementOut])
-def user_achievements_by_id(user_id: int):
-    unlocked = get_user_achievements(user_id)
+async def user_achievements_by_id(user_id: int):
+    unlocked = await get_user_achievements_async(user_id)
     return [
         {
             'code': a['code'],
@@ -193,57 +165,36 @@ def user_achievements_by_id(user_id: int):
 
 @router.get("/user/{username}/achievements",
             response_model=List[AchievementOut])
-def user_achievements_by_username(username: str):
-    user = get_user_by_username(username)
+async def user_achievements_by_username(username: str):
+    user = await get_user_by_username_async(username)
     if not user:
         raise HTTPException(status_code=404, detail={"code": "user_not_found"})
-    return user_achievements_by_id(user['id'])
+    return await user_achievements_by_id(user['id'])
 
 
 @router.get("/user/{username}/tests", response_model=List[TestOut])
-def user_tests_by_username(username: str):
-    user = get_user_by_username(username)
+async def user_tests_by_username(username: str):
+    user = await get_user_by_username_async(username)
     if not user:
         raise HTTPException(status_code=404, detail={"code": "user_not_found"})
-    return get_user_tests(user['id'])
+    return await get_user_tests_async(user['id'])
 
 
 @router.get("/user/{username}/stats", response_model=StatsOut)
-def user_stats_by_username(username: str):
-    user = get_user_by_username(username)
+async def user_stats_by_username(username: str):
+    user = await get_user_by_username_async(username)
     if not user:
         raise HTTPException(status_code=404, detail={"code": "user_not_found"})
-    tests = get_user_tests(user['id'])
-    scores = get_user_scores(user['id'])
-    if not tests:
-        return StatsOut(
-            passed=0,
-            total=0,
-            average=0.0,
-            fundamentals=scores['fundamentals'],
-            algorithms=scores['algorithms']
-        )
-    passed = sum(t['passed'] for t in tests)
-    total = sum(t['total'] for t in tests)
-    average = (
-        sum(t['average'] for t in tests) / len(tests)
-    ) if tests else 0.0
-    return StatsOut(
-        passed=passed,
-        total=total,
-        average=average,
-        fundamentals=scores['fundamentals'],
-        algorithms=scores['algorithms']
-    )
+    return StatsOut(**await get_user_stats_async(user['id']))
 
 
 @router.get("/user/{username}/recommendations", response_model=List[str])
-def user_topic_recommendations(username: str):
-    user = get_user_by_username(username)
+async def user_topic_recommendations(username: str):
+    user = await get_user_by_username_async(username)
     if not user:
         raise HTTPException(status_code=404, detail={"code": "user_not_found"})
     topic_scores, topic_counts = {}, {}
-    for test in get_user_tests(user["id"]):
+    for test in await get_user_tests_async(user["id"]):
         if not test.get("topics") or not test["total"]:
             continue
         for topic in test["topics"]:
@@ -252,16 +203,5 @@ def user_topic_recommendations(username: str):
     topic_avgs = {t: topic_scores[t] / topic_counts[t] for t in topic_scores}
     recommendations = [t for t, _ in sorted(topic_avgs.items(), key=lambda x: x[1])[:6]]
     if len(recommendations) < 6:
-        needed = 6 - len(recommendations)
-        if recommendations:
-            placeholders = ",".join(["%s"] * len(recommendations))
-            sql = f"SELECT label FROM topics WHERE label NOT IN ({placeholders}) ORDER BY RAND() LIMIT %s"
-            params = recommendations + [needed]
-        else:
-            sql = "SELECT label FROM topics ORDER BY RAND() LIMIT %s"
-            params = [needed]
-        rows = execute(sql, params)
-        for r in rows:
-            if r[0] not in recommendations:
-                recommendations.append(r[0])
+        recommendations += random_topic_labels(6 - len(recommendations), recommendations)
     return recommendations
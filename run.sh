@@ -39,6 +39,8 @@ fi
 VENV_DIR="venv"
 PID_FILE="server.pid"
 LOG_FILE="server.log"
+REGRADE_PID_FILE="regrade.pid"
+REGRADE_LOG_FILE="regrade.log"
 SSL_CERT_FILE="/etc/letsencrypt/live/cs-trainer.ru/fullchain.pem"
 SSL_KEY_FILE="/etc/letsencrypt/live/cs-trainer.ru/privkey.pem"
 SSL_PORT=443
@@ -59,6 +61,9 @@ else
     exit 1
 fi
 
+echo "Creating missing tables..."
+python manage.py rebuild-stats --if-missing
+
 stop_server() {
     if [ -f "${PID_FILE}" ]; then
         local pid=$(cat "${PID_FILE}")
@@ -86,6 +91,14 @@ if [ ! -f "${SSL_CERT_FILE}" ] || [ ! -f "${SSL_KEY_FILE}" ]; then
     exit 1
 fi
 
+# regrade jobs scheduled by question edits run here, outside the web workers
+if [ -f "${REGRADE_PID_FILE}" ]; then
+    kill "$(cat "${REGRADE_PID_FILE}")" 2>/dev/null || true
+    rm -f "${REGRADE_PID_FILE}"
+fi
+nohup python manage.py regrade --watch > "${REGRADE_LOG_FILE}" 2>&1 &
+echo $! > "${REGRADE_PID_FILE}"
+
 echo "Starting Uvicorn server with SSL..."
 
 sudo -E env PATH=$PATH:${VENV_DIR}/bin nohup uvicorn main:app --host 0.0.0.0 --port ${SSL_PORT} --ssl-keyfile "${SSL_KEY_FILE}" --ssl-certfile "${SSL_CERT_FILE}" > "${LOG_FILE}" 2>&1 &
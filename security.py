@@ -1,7 +1,13 @@
 import os
 import jwt
 import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional
+from fastapi import Header, HTTPException
+from jwt import ExpiredSignatureError, InvalidTokenError
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 
@@ -13,18 +19,21 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(
     os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+# verified tokens remembered per process, so repeat requests skip the HMAC
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# raising BCRYPT_ROUNDS upgrades weaker hashes as their users log in
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS
+)
 
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
 def create_access_token(
         data: dict, expires_delta: Optional[datetime.timedelta] = None) -> str:
     to_encode = data.copy()
@@ -40,3 +49,46 @@ def create_access_token(
 
 def decode_access_token(token: str) -> dict:
     return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+_token_lock = threading.Lock()
+# blake2b(token) -> (exp, payload), least recently used first
+_verified_tokens: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+
+
+def verify_access_token(token: str) -> dict:
+    """decode_access_token with a bounded LRU of tokens already verified.
+
+    Entries are dropped once their exp has passed, so an expired token
+    fails exactly as it would without the cache.
+    """
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    now = time.time()
+    with _token_lock:
+        cached = _verified_tokens.get(key)
+        if cached is not None:
+            if cached[0] > now:
+                _verified_tokens.move_to_end(key)
+                return cached[1]
+            del _verified_tokens[key]
+    payload = decode_access_token(token)
+    with _token_lock:
+        _verified_tokens[key] = (payload.get("exp", now), payload)
+        if len(_verified_tokens) > TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+    return payload
+
+
+async def current_user(authorization: str = Header(None, alias="Authorization")) -> dict:
+    """FastAPI dependency: the bearer token's user as {"id": ..., "email": ...}"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail={"code": "missing_token"})
+    try:
+        payload = verify_access_token(authorization[7:])
+    except ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail={"code": "token_expired"})
+    except InvalidTokenError:
+        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
+    if not payload.get("user_id") or not payload.get("sub"):
+        raise HTTPException(status_code=401, detail={"code": "invalid_token"})
+    return {"id": payload["user_id"], "email": payload["sub"]}
@@ -1,35 +1,31 @@
 from typing import Dict, Any
-from database import execute, redis_client
+from database import execute, aexecute, session
+from services.cache_service import cached, invalidate
 from services.achievement_definitions import ACHIEVEMENT_DEFINITIONS
-import json
 from pymysql.err import IntegrityError
 
 
 def sync_definitions() -> None:
-    rows = execute("SELECT code FROM achievements")
-    existing = {row[0] for row in rows}
-    for code, defn in ACHIEVEMENT_DEFINITIONS.items():
-        if code not in existing:
-            execute(
-                "INSERT INTO achievements(code, emoji) VALUES (%s, %s)",
-                (code, defn.get('emoji', ''))
-            )
+    with session() as db:
+        rows = db.execute("SELECT code FROM achievements")
+        existing = {row[0] for row in rows}
+        db.executemany(
+            "INSERT INTO achievements(code, emoji) VALUES (%s, %s)",
+            [(code, defn.get('emoji', ''))
+             for code, defn in ACHIEVEMENT_DEFINITIONS.items() if code not in existing]
+        )
 
 
+@cached("achievements:definitions", soft_ttl=15, hard_ttl=300)
 def get_definitions() -> Dict[str, Dict[str, Any]]:
-    cached = redis_client.get("achievements:definitions")
-    if cached:
-        return json.loads(cached)
     sync_definitions()
     rows = execute(
         "SELECT id, code, emoji FROM achievements ORDER BY id"
     )
-    defs = {
+    return {
         row[1]: {'id': row[0], 'code': row[1], 'emoji': row[2]}
         for row in rows
     }
-    redis_client.setex("achievements:definitions", 15, json.dumps(defs))
-    return defs
 
 
 def award_achievement(user_id: int, code: str) -> bool:
@@ -37,28 +33,27 @@ def award_achievement(user_id: int, code: str) -> bool:
     if code not in defs:
         return False
     ach_id = defs[code]['id']
-    exists = execute(
-        "SELECT 1 FROM user_achievements WHERE user_id=%s AND achievement_id=%s",
-        (user_id, ach_id), fetchone=True
-    )
-    if exists:
-        return False
-    try:
-        execute(
-            "INSERT INTO user_achievements(user_id, achievement_id) VALUES (%s, %s)",
-            (user_id, ach_id)
+    with session() as db:
+        exists = db.execute(
+            "SELECT 1 FROM user_achievements WHERE user_id=%s AND achievement_id=%s",
+            (user_id, ach_id), fetchone=True
         )
-        return True
-    except IntegrityError:
-        return False
+        if exists:
+            return False
+        try:
+            db.execute(
+                "INSERT INTO user_achievements(user_id, achievement_id) VALUES (%s, %s)",
+                (user_id, ach_id)
+            )
+        except IntegrityError:
+            return False
+    invalidate(f"user:{user_id}:achievements")
+    return True
 
 
-def get_user_achievements(user_id: int) -> list[dict]:
-    cache_key = f"user:{user_id}:achievements"
-    cached = redis_client.get(cache_key)
-    if cached:
-        return json.loads(cached)
-    rows = execute(
+@cached("user:{user_id}:achievements", soft_ttl=15, hard_ttl=120)
+async def get_user_achievements_async(user_id: int) -> list[dict]:
+    rows = await aexecute(
         "SELECT ua.unlocked_at, a.code, a.emoji"
         " FROM user_achievements ua"
         " JOIN achievements a ON ua.achievement_id = a.id"
@@ -66,21 +61,14 @@ def get_user_achievements(user_id: int) -> list[dict]:
         " ORDER BY ua.unlocked_at",
         (user_id,)
     )
-    result = []
-    for r in rows:
-        result.append({
+    return [
+        {
             'code': r[1],
             'emoji': r[2],
-            'unlocked_at': r[0]
-        })
-    cache_list = []
-    for a in result:
-        item = a.copy()
-        if item['unlocked_at'] is not None:
-            item['unlocked_at'] = item['unlocked_at'].isoformat()
-        cache_list.append(item)
-    redis_client.setex(cache_key, 15, json.dumps(cache_list))
-    return result
+            'unlocked_at': r[0].isoformat() if r[0] is not None else None
+        }
+        for r in rows
+    ]
 
 
 def check_and_award(user_id: int, event: str = None,
@@ -1,6 +1,10 @@
 import json
 import os
-from database import execute
+from database import execute, insert, session, transaction, redis_client
+from services.cache_service import VersionedSnapshot
+from services.grading_service import POINTS, compile_key
+from services.question_bank import bump_version
+from services.regrade_service import schedule_regrade
 from typing import Dict, Any, List, Optional
 from services.validation_service import (
     validate_question_text,
@@ -58,11 +62,21 @@ def get_proposed_questions() -> List[Dict[str, Any]]:
     return result
 
 
+def _question_out(question_id: int, q: Any) -> Dict[str, Any]:
+    return {
+        "id": question_id,
+        "question_text": q.question_text, "question_type": q.question_type,
+        "difficulty": q.difficulty, "options": q.options,
+        "correct_answer": q.correct_answer,
+        "topic_code": q.topic_code, "proposer_id": q.proposer_id
+    }
+
+
 def add_question(q: Any) -> Dict[str, Any]:
     validate_question_data(q)
     options_json = json.dumps(q.options, ensure_ascii=False)
     correct_answer_json = json.dumps(q.correct_answer, ensure_ascii=False)
-    execute(
+    question_id = insert(
         "INSERT INTO current_questions (question_text, question_type, difficulty, "
         "options, correct_answer, topic_code, proposer_id) VALUES (%s, %s, %s, %s, %s, %s, %s)",
         (q.question_text,
@@ -73,120 +87,113 @@ def add_question(q: Any) -> Dict[str, Any]:
          q.topic_code,
          q.proposer_id)
     )
-    row = execute(
-        "SELECT id, question_text, question_type, difficulty, options, correct_answer, topic_code, proposer_id "
-        "FROM current_questions ORDER BY id DESC LIMIT 1",
-        fetchone=True
-    )
-    return {
-        "id": row[0],
-        "question_text": row[1], "question_type": row[2], "difficulty": row[3],
-        "options": json.loads(row[4]), "correct_answer": json.loads(row[5]),
-        "topic_code": row[6], "proposer_id": row[7]
-    }
+    bump_version(question_id)
+    return _question_out(question_id, q)
 
 
 def update_question(question_id: int, q: Any) -> Optional[Dict[str, Any]]:
-    exists = execute(
-        "SELECT id FROM current_questions WHERE id = %s",
-        (question_id,),
-        fetchone=True
-    )
-    if not exists:
-        return None
-    validate_question_data(q)
-    options_json = json.dumps(q.options, ensure_ascii=False)
-    correct_answer_json = json.dumps(q.correct_answer, ensure_ascii=False)
-    execute(
-        "UPDATE current_questions SET question_text = %s, question_type = %s, difficulty = %s, "
-        "options = %s, correct_answer = %s, topic_code = %s, proposer_id = %s WHERE id = %s",
-        (q.question_text,
-         q.question_type,
-         q.difficulty,
-         options_json,
-         correct_answer_json,
-         q.topic_code,
-         q.proposer_id,
-         question_id)
-    )
-    row = execute(
-        "SELECT id, question_text, question_type, difficulty, options, correct_answer, topic_code, proposer_id "
-        "FROM current_questions WHERE id = %s",
-        (question_id,),
-        fetchone=True
-    )
-    return {"id": row[0],
-            "question_text": row[1], "question_type": row[2], "difficulty": row[3],
-            "options": json.loads(row[4]), "correct_answer": json.loads(row[5]),
-            "topic_code": row[6], "proposer_id": row[7]}
+    """Update a question; a changed answer key schedules a regrade of its answers"""
+    with session() as db:
+        old = db.execute(
+            "SELECT question_type, correct_answer, difficulty FROM current_questions WHERE id = %s",
+            (question_id,),
+            fetchone=True
+        )
+        if not old:
+            return None
+        validate_question_data(q)
+        old_type, old_correct, old_difficulty = old
+        old_correct = json.loads(old_correct) if old_correct else []
+        if isinstance(old_correct, str):
+            old_correct = json.loads(old_correct)
+        key_changed = compile_key(old_type, old_correct) != compile_key(q.question_type, q.correct_answer)
+        options_json = json.dumps(q.options, ensure_ascii=False)
+        correct_answer_json = json.dumps(q.correct_answer, ensure_ascii=False)
+        db.execute(
+            "UPDATE current_questions SET question_text = %s, question_type = %s, difficulty = %s, "
+            "options = %s, correct_answer = %s, topic_code = %s, proposer_id = %s WHERE id = %s",
+            (q.question_text,
+             q.question_type,
+             q.difficulty,
+             options_json,
+             correct_answer_json,
+             q.topic_code,
+             q.proposer_id,
+             question_id)
+        )
+    bump_version(question_id)
+    if key_changed:
+        # stored answers were scored at the difficulty before this edit
+        schedule_regrade(question_id, POINTS.get(old_difficulty, 0))
+    return _question_out(question_id, q)
 
 
 def delete_question(question_id: int) -> bool:
-    exists = execute(
-        "SELECT id FROM current_questions WHERE id = %s",
-        (question_id,),
-        fetchone=True
-    )
-    if not exists:
-        return False
-    execute(
-        "DELETE FROM current_questions WHERE id = %s",
-        (question_id,)
-    )
+    with session() as db:
+        exists = db.execute(
+            "SELECT id FROM current_questions WHERE id = %s",
+            (question_id,),
+            fetchone=True
+        )
+        if not exists:
+            return False
+        db.execute(
+            "DELETE FROM current_questions WHERE id = %s",
+            (question_id,)
+        )
+    bump_version(question_id)
     return True
 
 
 def approve_proposed_question(question_id: int) -> Optional[Dict[str, Any]]:
-    row = execute(
-        "SELECT id, question_text, question_type, difficulty, options, correct_answer, topic_code, proposer_id "
-        "FROM proposed_questions WHERE id = %s",
-        (question_id,),
-        fetchone=True
-    )
-    if not row:
-        return None
-    (
-        _, question_text, question_type, difficulty, options_json, correct_answer,
-        topic_code, proposer_id
-    ) = row
-    execute(
-        "INSERT INTO current_questions (question_text, question_type, difficulty, options, correct_answer, "
-        "topic_code, proposer_id) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-        (question_text,
-         question_type,
-         difficulty,
-         options_json,
-         correct_answer,
-         topic_code,
-         proposer_id)
-    )
-    execute(
-        "DELETE FROM proposed_questions WHERE id = %s",
-        (question_id,)
-    )
-    new = execute(
-        "SELECT id, question_text, question_type, difficulty, options, correct_answer, topic_code, proposer_id "
-        "FROM current_questions ORDER BY id DESC LIMIT 1",
-        fetchone=True
-    )
-    return {"id": new[0],
-            "question_text": new[1], "question_type": new[2], "difficulty": new[3],
-            "options": json.loads(new[4]), "correct_answer": json.loads(new[5]),
-            "topic_code": new[6], "proposer_id": new[7]}
+    with transaction() as db:
+        row = db.execute(
+            "SELECT id, question_text, question_type, difficulty, options, correct_answer, topic_code, proposer_id "
+            "FROM proposed_questions WHERE id = %s",
+            (question_id,),
+            fetchone=True
+        )
+        if not row:
+            return None
+        (
+            _, question_text, question_type, difficulty, options_json, correct_answer,
+            topic_code, proposer_id
+        ) = row
+        new_id = db.insert(
+            "INSERT INTO current_questions (question_text, question_type, difficulty, options, correct_answer, "
+            "topic_code, proposer_id) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            (question_text,
+             question_type,
+             difficulty,
+             options_json,
+             correct_answer,
+             topic_code,
+             proposer_id)
+        )
+        db.execute(
+            "DELETE FROM proposed_questions WHERE id = %s",
+            (question_id,)
+        )
+    bump_version(new_id)
+    return {"id": new_id,
+            "question_text": question_text, "question_type": question_type, "difficulty": difficulty,
+            "options": json.loads(options_json), "correct_answer": json.loads(correct_answer),
+            "topic_code": topic_code, "proposer_id": proposer_id}
 
 
 def reject_proposed_question(question_id: int) -> bool:
-    exists = execute(
-        "SELECT id FROM proposed_questions WHERE id = %s",
-        (question_id,),
-        fetchone=True
-    )
-    if not exists:
-        return False
-    execute(
-        "DELETE FROM proposed_questions WHERE id = %s",
-        (question_id,)
-    )
+    with session() as db:
+        exists = db.execute(
+            "SELECT id FROM proposed_questions WHERE id = %s",
+            (question_id,),
+            fetchone=True
+        )
+        if not exists:
+            return False
+        db.execute(
+            "DELETE FROM proposed_questions WHERE id = %s",
+            (question_id,)
+        )
     return True
 
 
@@ -194,7 +201,7 @@ def add_proposed_question(q: Any) -> Dict[str, Any]:
     validate_question_data(q)
     options_json = json.dumps(q.options, ensure_ascii=False)
     correct_answer_json = json.dumps(q.correct_answer, ensure_ascii=False)
-    execute(
+    question_id = insert(
         "INSERT INTO proposed_questions (question_text, question_type, difficulty, options, "
         "correct_answer, topic_code, proposer_id) VALUES (%s, %s, %s, %s, %s, %s, %s)",
         (q.question_text,
@@ -205,55 +212,53 @@ def add_proposed_question(q: Any) -> Dict[str, Any]:
          q.topic_code,
          q.proposer_id)
     )
-    row = execute(
-        "SELECT id, question_text, question_type, difficulty, options, correct_answer, topic_code, proposer_id "
-        "FROM proposed_questions ORDER BY id DESC LIMIT 1",
-        fetchone=True
-    )
-    return {
-        "id": row[0],
-        "question_text": row[1], "question_type": row[2], "difficulty": row[3],
-        "options": json.loads(row[4]), "correct_answer": json.loads(row[5]),
-        "topic_code": row[6], "proposer_id": row[7]
-    }
+    return _question_out(question_id, q)
 
 
 def update_proposed_question(
         question_id: int, q: Any) -> Optional[Dict[str, Any]]:
-    exists = execute(
-        "SELECT id FROM proposed_questions WHERE id = %s",
-        (question_id,), fetchone=True
-    )
-    if not exists:
-        return None
-    validate_question_data(q)
-    options_json = json.dumps(q.options, ensure_ascii=False)
-    correct_answer_json = json.dumps(q.correct_answer, ensure_ascii=False)
-    execute(
-        "UPDATE proposed_questions SET question_text=%s, question_type=%s, difficulty=%s, options=%s, "
-        "correct_answer=%s, topic_code=%s, proposer_id=%s WHERE id=%s",
-        (q.question_text, q.question_type, q.difficulty, options_json,
-         correct_answer_json, q.topic_code, q.proposer_id, question_id)
-    )
-    row = execute(
-        "SELECT id, question_text, question_type, difficulty, options, correct_answer, topic_code, proposer_id "
-        "FROM proposed_questions WHERE id = %s",
-        (question_id,), fetchone=True
-    )
-    return {
-        "id": row[0],
-        "question_text": row[1], "question_type": row[2], "difficulty": row[3],
-        "options": json.loads(row[4]), "correct_answer": json.loads(row[5]),
-        "topic_code": row[6], "proposer_id": row[7]
-    }
+    with session() as db:
+        exists = db.execute(
+            "SELECT id FROM proposed_questions WHERE id = %s",
+            (question_id,), fetchone=True
+        )
+        if not exists:
+            return None
+        validate_question_data(q)
+        options_json = json.dumps(q.options, ensure_ascii=False)
+        correct_answer_json = json.dumps(q.correct_answer, ensure_ascii=False)
+        db.execute(
+            "UPDATE proposed_questions SET question_text=%s, question_type=%s, difficulty=%s, options=%s, "
+            "correct_answer=%s, topic_code=%s, proposer_id=%s WHERE id=%s",
+            (q.question_text, q.question_type, q.difficulty, options_json,
+             correct_answer_json, q.topic_code, q.proposer_id, question_id)
+        )
+    return _question_out(question_id, q)
+
+
+# Admin ids are cached per worker, re-read when admins:version in Redis moves
+# and at least every ADMINS_TTL seconds.
+ADMINS_VERSION_KEY = "admins:version"
+ADMINS_TTL = 60.0
+
+
+def _load_admins(previous, previous_version, version) -> frozenset[int]:
+    return frozenset(r[0] for r in execute("SELECT user_id FROM admins"))
+
+
+_admins = VersionedSnapshot(ADMINS_VERSION_KEY, _load_admins, max_age=ADMINS_TTL)
+
+
+def invalidate_admins() -> int:
+    """Make every worker re-read the admins table"""
+    version = redis_client.incr(ADMINS_VERSION_KEY)
+    _admins.expire()
+    return version
 
 
 def is_user_admin(user_id: int) -> bool:
     """Return True if user_id is present in admins table"""
-    return execute(
-        "SELECT 1 FROM admins WHERE user_id = %s",
-        (user_id,), fetchone=True
-    ) is not None
+    return user_id in _admins.get()
 
 
 def get_settings() -> Dict[str, Any]:
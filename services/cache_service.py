@@ -0,0 +1,262 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import math
+import random
+import secrets
+import threading
+import time
+from typing import Any
+from database import redis_client, async_redis
+
+logger = logging.getLogger(__name__)
+
+# JSON cache helpers over Redis. Multi-key reads use MGET and multi-key
+# writes a single pipeline, so one request resolves several keys in one
+# round trip.
+
+
+def _decode(raw: bytes | None) -> Any:
+    return json.loads(raw) if raw is not None else None
+
+
+def json_default(value: Any) -> str:
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, default=json_default)
+
+
+def cache_get_many(keys: list[str]) -> dict[str, Any]:
+    """Return the cached values for keys, omitting misses"""
+    if not keys:
+        return {}
+    raw = redis_client.mget(keys)
+    return {k: _decode(v) for k, v in zip(keys, raw) if v is not None}
+
+
+def cache_set_many(values: dict[str, Any], ttl: int) -> None:
+    if not values:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for key, value in values.items():
+        pipe.set(key, _encode(value), ex=ttl)
+    pipe.execute()
+
+
+async def acache_get_many(keys: list[str]) -> dict[str, Any]:
+    if not keys:
+        return {}
+    raw = await async_redis.mget(keys)
+    return {k: _decode(v) for k, v in zip(keys, raw) if v is not None}
+
+
+async def acache_set_many(values: dict[str, Any], ttl: int) -> None:
+    if not values:
+        return
+    pipe = async_redis.pipeline(transaction=False)
+    for key, value in values.items():
+        pipe.set(key, _encode(value), ex=ttl)
+    await pipe.execute()
+
+
+# Stale-while-revalidate caching. An entry is stored as {"v": value,
+# "soft": expiry} under cache:<key> with the hard TTL as its Redis expiry.
+# Past the soft expiry the stale value is still served while whoever takes
+# lock:cache:<key> recomputes it; a miss waits for the lock holder instead of
+# recomputing in parallel. Both TTLs get random jitter so entries written
+# together do not expire together.
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_release_lock = redis_client.register_script(_RELEASE_SCRIPT)
+_release_lock_async = async_redis.register_script(_RELEASE_SCRIPT)
+_WAIT_STEP = 0.05
+
+
+def _entry(value: Any, soft_ttl: float, hard_ttl: float, jitter: float) -> tuple[str, int]:
+    soft = soft_ttl * (1 + random.uniform(0, jitter))
+    hard = max(hard_ttl * (1 + random.uniform(0, jitter)), soft)
+    return _encode({"v": value, "soft": time.time() + soft}), math.ceil(hard)
+
+
+def invalidate(*keys: str) -> None:
+    """Drop entries written by @cached, given their unprefixed keys"""
+    if keys:
+        redis_client.delete(*(f"cache:{k}" for k in keys))
+
+
+def cached(key: str, soft_ttl: float, hard_ttl: float,
+           jitter: float = 0.1, lock_ttl: int = 10):
+    """Cache a function's JSON result in Redis with single-flight refresh.
+
+    key is formatted with the call's arguments, e.g. "user:{user_id}".
+    Works on both plain and async functions.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        def cache_key(args, kwargs) -> str:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return "cache:" + key.format(**bound.arguments)
+
+        if inspect.iscoroutinefunction(fn):
+            inflight: dict[str, asyncio.Task] = {}
+
+            def track(ckey: str, coro) -> asyncio.Task:
+                task = asyncio.get_running_loop().create_task(coro)
+                inflight[ckey] = task
+                task.add_done_callback(
+                    lambda t: inflight.pop(ckey) if inflight.get(ckey) is t else None)
+                return task
+
+            async def refresh(ckey: str, args, kwargs, token: str | None = None):
+                try:
+                    value = await fn(*args, **kwargs)
+                    payload, ttl = _entry(value, soft_ttl, hard_ttl, jitter)
+                    await async_redis.set(ckey, payload, ex=ttl)
+                    return value
+                finally:
+                    if token:
+                        await _release_lock_async(keys=[f"lock:{ckey}"], args=[token])
+
+            async def revalidate(ckey: str, args, kwargs, token: str) -> None:
+                try:
+                    await refresh(ckey, args, kwargs, token)
+                except Exception:
+                    logger.exception("Cache refresh of %s failed", ckey)
+
+            async def fill(ckey: str, args, kwargs):
+                deadline = time.monotonic() + lock_ttl
+                while True:
+                    token = secrets.token_hex(8)
+                    if await async_redis.set(f"lock:{ckey}", token, nx=True, ex=lock_ttl):
+                        return await refresh(ckey, args, kwargs, token)
+                    await asyncio.sleep(_WAIT_STEP)
+                    raw = await async_redis.get(ckey)
+                    if raw is not None:
+                        return json.loads(raw)["v"]
+                    if time.monotonic() > deadline:
+                        return await refresh(ckey, args, kwargs)
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                ckey = cache_key(args, kwargs)
+                raw = await async_redis.get(ckey)
+                if raw is not None:
+                    entry = json.loads(raw)
+                    if entry["soft"] < time.time() and ckey not in inflight:
+                        token = secrets.token_hex(8)
+                        if await async_redis.set(f"lock:{ckey}", token, nx=True, ex=lock_ttl):
+                            track(ckey, revalidate(ckey, args, kwargs, token))
+                    return entry["v"]
+                task = inflight.get(ckey) or track(ckey, fill(ckey, args, kwargs))
+                return await task
+
+            return async_wrapper
+
+        def refresh_sync(ckey: str, args, kwargs, token: str | None = None):
+            try:
+                value = fn(*args, **kwargs)
+                payload, ttl = _entry(value, soft_ttl, hard_ttl, jitter)
+                redis_client.set(ckey, payload, ex=ttl)
+                return value
+            finally:
+                if token:
+                    _release_lock(keys=[f"lock:{ckey}"], args=[token])
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            ckey = cache_key(args, kwargs)
+            raw = redis_client.get(ckey)
+            if raw is not None:
+                entry = json.loads(raw)
+                if entry["soft"] < time.time():
+                    token = secrets.token_hex(8)
+                    if redis_client.set(f"lock:{ckey}", token, nx=True, ex=lock_ttl):
+                        return refresh_sync(ckey, args, kwargs, token)
+                return entry["v"]
+            deadline = time.monotonic() + lock_ttl
+            while True:
+                token = secrets.token_hex(8)
+                if redis_client.set(f"lock:{ckey}", token, nx=True, ex=lock_ttl):
+                    return refresh_sync(ckey, args, kwargs, token)
+                time.sleep(_WAIT_STEP)
+                raw = redis_client.get(ckey)
+                if raw is not None:
+                    return json.loads(raw)["v"]
+                if time.monotonic() > deadline:
+                    return refresh_sync(ckey, args, kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class VersionedSnapshot:
+    """Process-local copy of rarely changing data, such as a whole table.
+
+    Writers publish a change by bumping the integer at version_key in Redis.
+    load(previous, previous_version, version) builds the new snapshot; it is
+    given the old one (None on the first load) so it can patch a copy.
+    Snapshots are replaced whole and never mutated, so get() reads one
+    without locking. Once the last version check is interval seconds old,
+    get() starts a check in a background thread and keeps returning the
+    current snapshot meanwhile; with max_age the data is also reloaded that
+    often when the version has not moved. Only the very first get() loads
+    inline; call refresh() off the event loop at startup to avoid it.
+    """
+
+    def __init__(self, version_key: str, load, interval: float = 1.0,
+                 max_age: float | None = None):
+        self.version_key = version_key
+        self._load = load
+        self._interval = interval
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        # (version, snapshot, loaded_at)
+        self._state: tuple[int, Any, float] | None = None
+        self._checked_at = 0.0
+        self._refreshing = False
+
+    def refresh(self) -> None:
+        """Reload now if the version moved or the data is too old"""
+        with self._lock:
+            now = time.monotonic()
+            self._checked_at = now
+            version = int(redis_client.get(self.version_key) or 0)
+            state = self._state
+            if state is not None and state[0] == version and (
+                    self._max_age is None or now - state[2] < self._max_age):
+                return
+            previous, previous_version = (state[1], state[0]) if state else (None, None)
+            self._state = (version, self._load(previous, previous_version, version), now)
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Refreshing %s failed, serving the previous snapshot", self.version_key)
+        finally:
+            self._refreshing = False
+
+    def get(self) -> Any:
+        state = self._state
+        if state is None:
+            self.refresh()
+            return self._state[1]
+        if not self._refreshing and time.monotonic() - self._checked_at >= self._interval:
+            self._refreshing = True
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return state[1]
+
+    def expire(self) -> None:
+        """Check the version on the next get(), e.g. after bumping it"""
+        self._checked_at = 0.0
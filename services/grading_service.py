@@ -0,0 +1,83 @@
+from typing import Iterable
+
+# Grading against precompiled answer keys. A key is the normalized correct
+# answer, built once when a question is loaded, so grading one answer is a
+# single tuple comparison. Multi-answer multiple-choice questions ignore the
+# order of the chosen options; every other type compares item by item.
+POINTS = {"easy": 1, "medium": 2, "hard": 5}
+
+
+def _normalize(items) -> tuple[str, ...]:
+    return tuple(str(item).strip().lower() for item in items)
+
+
+def compile_key(question_type: str, correct_answer: list) -> tuple[bool, tuple[str, ...]]:
+    """Return (order_matters, normalized key) for a question's correct answer"""
+    if question_type == 'multiple-choice' and len(correct_answer) > 1:
+        return False, tuple(sorted(_normalize(correct_answer)))
+    return True, _normalize(correct_answer)
+
+
+def is_correct(answer_key: tuple[bool, tuple[str, ...]], user_answer: list) -> bool:
+    ordered, key = answer_key
+    if len(user_answer) != len(key):
+        return False
+    normalized = _normalize(user_answer)
+    return normalized == key if ordered else tuple(sorted(normalized)) == key
+
+
+def grading_snapshot(questions: list[dict]) -> list[dict]:
+    """Return the part of question records needed to grade them, JSON-ready"""
+    return [
+        {"id": q["id"], "question_type": q["question_type"], "difficulty": q["difficulty"],
+         "correct_answer": q["correct_answer"], "answer_key": q["answer_key"]}
+        for q in questions
+    ]
+
+
+def load_snapshot(snapshot: list[dict]) -> dict[int, dict]:
+    """Index a decoded grading_snapshot by question id, restoring key tuples"""
+    result = {}
+    for q in snapshot:
+        ordered, key = q["answer_key"]
+        result[q["id"]] = {**q, "answer_key": (ordered, tuple(key))}
+    return result
+
+
+def grade_submission(questions: list[dict], submitted: dict[int, list]) -> dict:
+    """Grade answers to the given questions in one pass.
+
+    questions are question bank records; submitted maps question id to the
+    user's answer. Returns passed, earned_score and one
+    (question_id, user_answer, correct_answer, is_correct) tuple per question.
+    """
+    passed = 0
+    earned_score = 0
+    graded = []
+    for q in questions:
+        user_answer = submitted[q["id"]]
+        correct = is_correct(q["answer_key"], user_answer)
+        if correct:
+            passed += 1
+            earned_score += POINTS.get(q["difficulty"], 0)
+        graded.append((q["id"], user_answer, q["correct_answer"], correct))
+    return {"passed": passed, "earned_score": earned_score, "answers": graded}
+
+
+def regrade(answers: Iterable[tuple], keys: dict[int, tuple]) -> list[tuple]:
+    """Regrade stored answers against new keys.
+
+    answers yields (answer_id, question_id, user_answer, was_correct) and keys
+    maps question id to a compiled key. Returns (answer_id, question_id,
+    is_correct) for every answer whose verdict changed; answers to questions
+    without a key are left alone.
+    """
+    changed = []
+    for answer_id, question_id, user_answer, was_correct in answers:
+        key = keys.get(question_id)
+        if key is None:
+            continue
+        correct = is_correct(key, user_answer)
+        if correct != bool(was_correct):
+            changed.append((answer_id, question_id, correct))
+    return changed
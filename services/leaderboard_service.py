@@ -1,48 +1,263 @@
+import asyncio
+import gzip
+import hashlib
 import json
-from database import execute, redis_client
-
-
-def get_leaderboard(number_of_users: int = 100) -> dict:
-    cache_key = f"leaderboard:{number_of_users}"
-    cached = redis_client.get(cache_key)
-    if cached:
-        return json.loads(cached)
-    fund_query = """
-        SELECT f.id, f.user_id, f.score, f.testsPassed, f.totalTests, f.lastActivity,
-               u.username, u.achievement, u.avatar
-        FROM fundamentals AS f
-        JOIN users AS u ON f.user_id = u.id
-        ORDER BY f.score DESC
-        LIMIT %s
+import time
+from database import asession, execute, redis_client, async_redis
+from services.cache_service import cached, json_default
+from services.achievement_service import check_and_award
+from services.write_behind_service import DEAD_LETTER_KEY, STREAM_KEY, extend_pause, paused_writes
+
+SECTIONS = ('fundamentals', 'algorithms')
+# marks that the sorted sets below hold every user's score
+READY_KEY = "leaderboard:ready"
+MAX_PAGE_SIZE = 100
+MAX_NEIGHBOURS = 50
+# how long a process serves its rendered /leaderboard body before rebuilding it
+RENDER_INTERVAL = 1.0
+
+# Adds the scores of submissions not yet written to MySQL (queued or
+# dead-lettered) to a rebuilt set, then swaps it in.
+# KEYS: queue stream, dead-letter stream, rebuilt set, live set
+# ARGV: the section
+_SWAP_SCRIPT = redis_client.register_script(
     """
-    alg_query = """
-        SELECT a.id, a.user_id, a.score, a.testsPassed, a.totalTests, a.lastActivity,
-               u.username, u.achievement, u.avatar
-        FROM algorithms AS a
-        JOIN users AS u ON a.user_id = u.id
-        ORDER BY a.score DESC
-        LIMIT %s
+    for i = 1, 2 do
+        for _, entry in ipairs(redis.call('XRANGE', KEYS[i], '-', '+')) do
+            local fields = entry[2]
+            for j = 1, #fields, 2 do
+                if fields[j] == 'data' then
+                    local ok, s = pcall(cjson.decode, fields[j + 1])
+                    if ok then
+                        local section = s.section == 'fundamentals' and 'fundamentals' or 'algorithms'
+                        if section == ARGV[1] and (tonumber(s.earned_score) or 0) ~= 0 then
+                            redis.call('ZINCRBY', KEYS[3], s.earned_score, tostring(s.user_id))
+                        end
+                    end
+                end
+            end
+        end
+    end
+    if redis.call('EXISTS', KEYS[3]) == 1 then
+        redis.call('RENAME', KEYS[3], KEYS[4])
+    else
+        redis.call('DEL', KEYS[4])
+    end
     """
-    fund_data = execute(fund_query, (number_of_users,))
-    alg_data = execute(alg_query, (number_of_users,))
-
-    fundamentals = [
-        {
-            'user_id': r[1], 'score': r[2], 'testsPassed': r[3],
-            'totalTests': r[4], 'lastActivity': r[5],
-            'username': r[6], 'achievement': r[7], 'avatar': r[8]
-        }
-        for r in fund_data
-    ]
-    algorithms = [
-        {
-            'user_id': r[1], 'score': r[2], 'testsPassed': r[3],
-            'totalTests': r[4], 'lastActivity': r[5],
-            'username': r[6], 'achievement': r[7], 'avatar': r[8]
+)
+
+_rebuild_lock = asyncio.Lock()
+_render_lock = asyncio.Lock()
+_rendered: dict[int, tuple[float, dict]] = {}
+
+
+def ranking_key(section: str) -> str:
+    return f"leaderboard:{section}:scores"
+
+
+def rebuild_leaderboard(chunk_size: int = 10000) -> dict[str, int]:
+    """Reload the sorted sets from MySQL, for cold start or repair.
+
+    Write-behind workers are paused meanwhile, so every submission is either
+    in MySQL or still in the write-behind streams; the scores of the latter
+    are added back as each set is swapped in. Each set is filled under a
+    temporary key and swapped in by one script, so readers never see a
+    partial ranking. Regrades running meanwhile may be lost; rerun it.
+    """
+    counts = {}
+    with paused_writes():
+        for section in SECTIONS:
+            tmp_key = ranking_key(section) + ":rebuild"
+            redis_client.delete(tmp_key)
+            last_id = 0
+            counts[section] = 0
+            while True:
+                rows = execute(
+                    f"SELECT user_id, score FROM {section} WHERE user_id > %s "
+                    f"ORDER BY user_id LIMIT %s",
+                    (last_id, chunk_size)
+                )
+                if not rows:
+                    break
+                redis_client.zadd(tmp_key, {str(user_id): score or 0 for user_id, score in rows})
+                counts[section] += len(rows)
+                last_id = rows[-1][0]
+                extend_pause()
+            _SWAP_SCRIPT(keys=[STREAM_KEY, DEAD_LETTER_KEY, tmp_key, ranking_key(section)], args=[section])
+    redis_client.set(READY_KEY, 1)
+    return counts
+
+
+async def _ensure_ready() -> None:
+    if await async_redis.exists(READY_KEY):
+        return
+    async with _rebuild_lock:
+        if not await async_redis.exists(READY_KEY):
+            await asyncio.to_thread(rebuild_leaderboard)
+
+
+def add_user(user_id: int) -> None:
+    """Register a new user with a zero score in every section"""
+    pipe = redis_client.pipeline()
+    for section in SECTIONS:
+        pipe.zadd(ranking_key(section), {str(user_id): 0})
+    pipe.execute()
+
+
+def remove_user(user_id: int) -> None:
+    pipe = redis_client.pipeline()
+    for section in SECTIONS:
+        pipe.zrem(ranking_key(section), str(user_id))
+    pipe.execute()
+
+
+async def get_ranked_scores(user_id: int) -> dict[str, int]:
+    """Return the user's current score in every section"""
+    await _ensure_ready()
+    pipe = async_redis.pipeline(transaction=False)
+    for section in SECTIONS:
+        pipe.zscore(ranking_key(section), str(user_id))
+    scores = await pipe.execute()
+    return {section: int(score or 0) for section, score in zip(SECTIONS, scores)}
+
+
+async def _hydrate(section: str, ranked: list[tuple[bytes, float]]) -> list[dict]:
+    """Attach user details to (user_id, score) pairs, keeping their order"""
+    if not ranked:
+        return []
+    user_ids = [int(member) for member, _ in ranked]
+    placeholders = ",".join(["%s"] * len(user_ids))
+    async with asession() as db:
+        rows = await db.execute(
+            f"SELECT s.user_id, s.testsPassed, s.totalTests, s.lastActivity, "
+            f"u.username, u.achievement, u.avatar "
+            f"FROM {section} AS s JOIN users AS u ON s.user_id = u.id "
+            f"WHERE s.user_id IN ({placeholders})",
+            tuple(user_ids)
+        )
+    details = {r[0]: r for r in rows}
+    entries = []
+    for user_id, (_, score) in zip(user_ids, ranked):
+        r = details.get(user_id)
+        if not r:
+            continue
+        entries.append({
+            'user_id': user_id, 'score': int(score), 'testsPassed': r[1],
+            'totalTests': r[2], 'lastActivity': r[3],
+            'username': r[4], 'achievement': r[5], 'avatar': r[6]
+        })
+    return entries
+
+
+async def get_leaderboard_page(section: str, offset: int = 0,
+                               limit: int = MAX_PAGE_SIZE) -> dict:
+    """Return one page of a section's leaderboard in O(log N + limit)"""
+    await _ensure_ready()
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    pipe = async_redis.pipeline(transaction=False)
+    pipe.zrevrange(ranking_key(section), offset, offset + limit - 1, withscores=True)
+    pipe.zcard(ranking_key(section))
+    ranked, total = await pipe.execute()
+    return {
+        'entries': await _hydrate(section, ranked),
+        'offset': offset,
+        'limit': limit,
+        'total': total
+    }
+
+
+async def get_user_standing(user_id: int, neighbours: int = 5) -> dict:
+    """Return rank, percentile and the users ranked around user_id per section.
+
+    Sections where the user is unranked map to None. Every lookup is a
+    sorted set rank or range query, so the cost does not grow with the
+    number of users beyond O(log N).
+    """
+    await _ensure_ready()
+    neighbours = max(0, min(neighbours, MAX_NEIGHBOURS))
+    pipe = async_redis.pipeline(transaction=False)
+    for section in SECTIONS:
+        pipe.zrevrank(ranking_key(section), str(user_id))
+        pipe.zscore(ranking_key(section), str(user_id))
+        pipe.zcard(ranking_key(section))
+    replies = await pipe.execute()
+    standings = {}
+    pipe = async_redis.pipeline(transaction=False)
+    for i, section in enumerate(SECTIONS):
+        rank, score, total = replies[3 * i:3 * i + 3]
+        if rank is None:
+            standings[section] = None
+            continue
+        start = max(0, rank - neighbours)
+        pipe.zrevrange(ranking_key(section), start, rank + neighbours, withscores=True)
+        standings[section] = {
+            'rank': rank + 1,
+            'score': int(score),
+            'total': total,
+            # share of users ranked strictly below this one
+            'percentile': round(100 * (total - rank - 1) / total, 2),
+            'first_rank': start + 1
         }
-        for r in alg_data
-    ]
+    ranges = iter(await pipe.execute())
+    for section, standing in standings.items():
+        if standing is None:
+            continue
+        ranked = next(ranges)
+        first_rank = standing.pop('first_rank')
+        ranks = {int(member): first_rank + i for i, (member, _) in enumerate(ranked)}
+        entries = await _hydrate(section, ranked)
+        for entry in entries:
+            entry['rank'] = ranks[entry['user_id']]
+        standing['neighbours'] = entries
+    return standings
+
 
-    result = {'fundamentals': fundamentals, 'algorithms': algorithms}
-    redis_client.setex(cache_key, 60, json.dumps(result, default=str))
+@cached("leaderboard:{number_of_users}", soft_ttl=5, hard_ttl=60)
+async def get_leaderboard(number_of_users: int = 100) -> dict:
+    result = {}
+    for section in SECTIONS:
+        page = await get_leaderboard_page(section, 0, number_of_users)
+        result[section] = page['entries']
     return result
+
+
+def _render(data: dict) -> dict:
+    body = json.dumps(data, default=json_default, separators=(',', ':')).encode()
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    return {
+        'etag': f'"{digest}"',
+        'body': body,
+        # a strong validator must differ between content codings
+        'gzip_etag': f'"{digest}-gz"',
+        'gzip': gzip.compress(body, 6),
+        'top': {section: [e['user_id'] for e in data.get(section, [])[:3]] for section in SECTIONS}
+    }
+
+
+def _award_top(top: dict[str, list[int]]) -> None:
+    for user_ids in top.values():
+        for user_id in user_ids:
+            check_and_award(user_id, 'leaderboard_top3')
+
+
+async def get_leaderboard_snapshot(number_of_users: int = 100) -> dict:
+    """Return the leaderboard as ready-to-send bytes.
+
+    The result holds the JSON body and its gzip encoding, each with its own
+    strong ETag. It
+    is rebuilt from get_leaderboard at most once per RENDER_INTERVAL per
+    process, and the top-3 badges are awarded whenever the body changes.
+    """
+    entry = _rendered.get(number_of_users)
+    if entry and time.monotonic() - entry[0] < RENDER_INTERVAL:
+        return entry[1]
+    async with _render_lock:
+        entry = _rendered.get(number_of_users)
+        if entry and time.monotonic() - entry[0] < RENDER_INTERVAL:
+            return entry[1]
+        snapshot = _render(await get_leaderboard(number_of_users))
+        _rendered[number_of_users] = (time.monotonic(), snapshot)
+    if not entry or entry[1]['etag'] != snapshot['etag']:
+        asyncio.get_running_loop().create_task(asyncio.to_thread(_award_top, snapshot['top']))
+    return snapshot
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from fastapi import HTTPException
+import security
+
+# bcrypt runs in a pool of worker processes so hashing neither holds this
+# process's GIL nor runs on the event loop. The auth routes are sync and wait
+# for the result on a threadpool thread, so at most MAX_PENDING operations
+# may be queued or running: by default a quarter of Starlette's threadpool
+# (THREADPOOL_SIZE, anyio's default limit), leaving the rest to other
+# routes. Beyond that callers get 503 right away instead of piling up in the
+# threadpool behind a login storm.
+THREADPOOL_SIZE = 40
+POOL_SIZE = int(os.getenv("PASSWORD_POOL_SIZE", str(os.cpu_count() or 1)))
+MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", str(min(POOL_SIZE * 2, THREADPOOL_SIZE // 4))))
+
+_lock = threading.Lock()
+_pool: ProcessPoolExecutor | None = None
+_pending = 0
+_metrics = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0,
+            "failed": 0, "peak_pending": 0, "seconds": 0.0}
+
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return security.pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, because forking a process that runs threads and an event loop is unsafe
+        _pool = ProcessPoolExecutor(POOL_SIZE, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _done(metric: str, started: float, future: Future) -> None:
+    global _pending
+    with _lock:
+        _pending -= 1
+        _metrics["seconds"] += time.perf_counter() - started
+        if future.exception() is not None:
+            _metrics["failed"] += 1
+        else:
+            _metrics[metric] += 1
+            if metric == "verified" and future.result()[1] is not None:
+                _metrics["rehashed"] += 1
+
+
+def _submit(metric: str, fn, *args) -> Future:
+    global _pending
+    with _lock:
+        if _pending >= MAX_PENDING:
+            _metrics["rejected"] += 1
+            raise HTTPException(status_code=503, detail={"code": "server_busy"})
+        _pending += 1
+        _metrics["peak_pending"] = max(_metrics["peak_pending"], _pending)
+        try:
+            future = _get_pool().submit(fn, *args)
+        except Exception:
+            _pending -= 1
+            raise
+    started = time.perf_counter()
+    future.add_done_callback(lambda f: _done(metric, started, f))
+    return future
+
+
+def hash_password(password: str) -> str:
+    """Hash in the pool; the calling thread waits without holding the GIL"""
+    return _submit("hashed", security.hash_password, password).result()
+
+
+def verify_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Return whether the password matches and, if its hash uses outdated
+    settings, a new hash to store in its place"""
+    return _submit("verified", _verify_and_update, plain_password, hashed_password).result()
+
+
+def password_metrics() -> dict:
+    with _lock:
+        done = _metrics["hashed"] + _metrics["verified"] + _metrics["failed"]
+        return {
+            **_metrics,
+            "pending": _pending,
+            "pool_size": POOL_SIZE,
+            "max_pending": MAX_PENDING,
+            "avg_ms": _metrics["seconds"] * 1000 / done if done else 0.0
+        }
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
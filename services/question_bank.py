@@ -0,0 +1,157 @@
+import json
+from typing import NamedTuple
+from database import execute, redis_client
+from services.cache_service import VersionedSnapshot
+from services.grading_service import compile_key
+from services.sampling_service import IdPool, sample_pools
+
+# In-process cache of current_questions, kept in sync across workers through
+# a version counter and a change log (question id -> version) in Redis.
+# Readers get an immutable _Bank snapshot; changes are applied to a copy.
+VERSION_KEY = "questions:version"
+CHANGES_KEY = "questions:changes"
+CHANGES_LIMIT = 1000
+# how often a worker asks Redis for a newer version, in seconds
+SYNC_INTERVAL = 1.0
+
+_QUESTION_COLUMNS = (
+    "id, question_text, question_type, difficulty, options, correct_answer, topic_code"
+)
+
+_BUMP_SCRIPT = redis_client.register_script(
+    """
+    local version = redis.call('INCR', KEYS[1])
+    for _, qid in ipairs(ARGV) do
+        redis.call('ZADD', KEYS[2], version, qid)
+    end
+    redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -%d)
+    return version
+    """ % (CHANGES_LIMIT + 1)
+)
+
+
+class _Bank(NamedTuple):
+    by_id: dict[int, dict]
+    all_ids: IdPool
+    by_topic: dict[str, IdPool]
+    by_difficulty: dict[str, IdPool]
+
+
+def _decode_row(row) -> dict:
+    qid, text, qtype, difficulty, options_json, correct_json, topic_code = row
+    correct = json.loads(correct_json) if correct_json else []
+    if isinstance(correct, str):
+        correct = json.loads(correct)
+    return {
+        "id": qid,
+        "question_text": text,
+        "question_type": qtype,
+        "difficulty": difficulty,
+        "options": json.loads(options_json) if options_json else [],
+        "correct_answer": correct,
+        "answer_key": compile_key(qtype, correct),
+        "topic_code": topic_code
+    }
+
+
+def _index(bank: _Bank, question: dict) -> None:
+    bank.by_id[question["id"]] = question
+    bank.all_ids.add(question["id"])
+    bank.by_topic.setdefault(question["topic_code"], IdPool()).add(question["id"])
+    bank.by_difficulty.setdefault(question["difficulty"], IdPool()).add(question["id"])
+
+
+def _unindex(bank: _Bank, question_id: int) -> None:
+    old = bank.by_id.pop(question_id, None)
+    if not old:
+        return
+    bank.all_ids.discard(question_id)
+    for index, key in ((bank.by_topic, old["topic_code"]), (bank.by_difficulty, old["difficulty"])):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(question_id)
+            if not ids:
+                del index[key]
+
+
+def _load_all() -> _Bank:
+    bank = _Bank({}, IdPool(), {}, {})
+    for row in execute(f"SELECT {_QUESTION_COLUMNS} FROM current_questions"):
+        _index(bank, _decode_row(row))
+    return bank
+
+
+def _load_ids(previous: _Bank, question_ids: list[int]) -> _Bank:
+    """Return a copy of previous with the given questions re-read"""
+    placeholders = ",".join(["%s"] * len(question_ids))
+    rows = execute(
+        f"SELECT {_QUESTION_COLUMNS} FROM current_questions WHERE id IN ({placeholders})",
+        tuple(question_ids)
+    )
+    bank = _Bank(
+        dict(previous.by_id),
+        IdPool(previous.all_ids),
+        {code: IdPool(ids) for code, ids in previous.by_topic.items()},
+        {difficulty: IdPool(ids) for difficulty, ids in previous.by_difficulty.items()}
+    )
+    for qid in question_ids:
+        _unindex(bank, qid)
+    for row in rows:
+        _index(bank, _decode_row(row))
+    return bank
+
+
+def _load(previous: _Bank | None, previous_version: int | None, version: int) -> _Bank:
+    """Bring the bank up to version.
+
+    Only the questions recorded in the change log since previous_version are
+    re-read; a full reload happens on first use or when the log has been
+    trimmed past previous_version.
+    """
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.zrange(CHANGES_KEY, 0, 0, withscores=True)
+    pipe.zrangebyscore(CHANGES_KEY, f"({previous_version or 0}", version)
+    oldest, changed = pipe.execute()
+    log_floor = int(oldest[0][1]) - 1 if oldest else version
+    if previous is None or previous_version < log_floor:
+        return _load_all()
+    if not changed:
+        return previous
+    return _load_ids(previous, [int(qid) for qid in changed])
+
+
+_bank = VersionedSnapshot(VERSION_KEY, _load, SYNC_INTERVAL)
+
+
+def preload() -> None:
+    """Load the bank now; blocks, so call it off the event loop"""
+    _bank.refresh()
+
+
+def bump_version(*question_ids: int) -> int:
+    """Publish a change of the given questions to every worker"""
+    version = _BUMP_SCRIPT(keys=[VERSION_KEY, CHANGES_KEY], args=list(question_ids))
+    _bank.expire()
+    return version
+
+
+def get_questions(question_ids: list[int]) -> list[dict]:
+    """Return cached questions in the given order, skipping unknown ids"""
+    by_id = _bank.get().by_id
+    return [by_id[qid] for qid in question_ids if qid in by_id]
+
+
+def sample_ids(topic_codes: list[str] | None, count: int) -> list[int]:
+    """Draw count distinct question ids, preferring the given topics.
+
+    If the topics hold fewer than count questions, all of them are taken and
+    the rest is filled with random questions from outside those topics.
+    """
+    bank = _bank.get()
+    if topic_codes is None:
+        return bank.all_ids.sample(count)
+    pools = [bank.by_topic[code] for code in set(topic_codes) if code in bank.by_topic]
+    selected = sample_pools(pools, count)
+    if len(selected) < count:
+        selected += bank.all_ids.sample(count - len(selected), exclude=selected)
+    return selected
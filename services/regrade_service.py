@@ -0,0 +1,249 @@
+import json
+import time
+from database import execute, transaction, redis_client
+from services.grading_service import POINTS, compile_key, regrade
+from services.leaderboard_service import ranking_key
+from services.stats_service import ADD_RESULTS
+from services.write_behind_service import STALE_KEY
+
+# Regrading of stored answers after a question's answer key changes. The
+# job for a question walks its test_answers in id order, CHUNK_SIZE rows at
+# a time, and applies each chunk's corrections to test_answers, tests and
+# the section tables in one short transaction. Progress lives in the Redis
+# hash regrade:<question_id>, so a job resumes where it stopped. Every
+# schedule_regrade bumps the hash's gen field; progress is recorded only if
+# gen is still the one the worker loaded its key under, so a reset made
+# while a chunk runs is never overwritten and the worker starts over with
+# the new key from the first answer. Re-running a chunk is harmless:
+# answers whose stored verdict already matches the key produce no
+# corrections. Score corrections use the points recorded with the job, the
+# question's weight before the edit that changed its key, so neither that
+# edit nor a later one that changes the difficulty reprices old answers.
+# Tests still open during an edit are graded against the old key and written
+# later by write_behind_service, which lists their questions in STALE_KEY;
+# run_pending_regrades restarts those jobs before running the pending ones.
+CHUNK_SIZE = 1000
+PENDING_KEY = "regrade:pending"
+LOCK_TTL = 300
+
+_ADVANCE_SCRIPT = redis_client.register_script(
+    """
+    if (redis.call('HGET', KEYS[1], 'gen') or '0') ~= ARGV[1] then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'status', ARGV[2], 'last_id', ARGV[3], 'updated_at', ARGV[4])
+    redis.call('HINCRBY', KEYS[1], 'processed', ARGV[5])
+    redis.call('HINCRBY', KEYS[1], 'changed', ARGV[6])
+    if ARGV[2] == 'done' then
+        redis.call('SREM', KEYS[2], ARGV[7])
+    end
+    return 1
+    """
+)
+
+
+def _job_key(question_id: int) -> str:
+    return f"regrade:{question_id}"
+
+
+def schedule_regrade(question_id: int, points: int | None = None) -> None:
+    """Reset the question's job to the first answer and mark it pending.
+
+    points is what a correct answer was worth when the stored answers were
+    scored. By default a job keeps the points it already has, and a new job
+    takes the question's current difficulty.
+    """
+    total, difficulty = execute(
+        "SELECT COUNT(*), (SELECT difficulty FROM current_questions WHERE id = %s) "
+        "FROM test_answers WHERE question_id = %s",
+        (question_id, question_id), fetchone=True
+    )
+    if points is None:
+        recorded = redis_client.hget(_job_key(question_id), "points")
+        points = int(recorded) if recorded is not None else POINTS.get(difficulty, 0)
+    pipe = redis_client.pipeline()
+    pipe.hincrby(_job_key(question_id), "gen", 1)
+    pipe.hset(_job_key(question_id), mapping={
+        "status": "pending", "last_id": 0, "total": total, "points": points,
+        "processed": 0, "changed": 0, "updated_at": time.time()
+    })
+    pipe.sadd(PENDING_KEY, question_id)
+    pipe.execute()
+
+
+def regrade_status(question_id: int) -> dict | None:
+    raw = redis_client.hgetall(_job_key(question_id))
+    if not raw:
+        return None
+    fields = {k.decode(): v.decode() for k, v in raw.items()}
+    return {
+        "question_id": question_id,
+        "status": fields["status"],
+        "total": int(fields["total"]),
+        "processed": int(fields["processed"]),
+        "changed": int(fields["changed"]),
+        "updated_at": float(fields["updated_at"])
+    }
+
+
+def pending_regrades() -> list[int]:
+    return sorted(int(qid) for qid in redis_client.smembers(PENDING_KEY))
+
+
+def _advance(question_id: int, gen: int, status: str, last_id: int,
+             processed: int = 0, changed: int = 0) -> bool:
+    """Record progress unless the job was rescheduled since generation gen"""
+    return bool(_ADVANCE_SCRIPT(
+        keys=[_job_key(question_id), PENDING_KEY],
+        args=[gen, status, last_id, time.time(), processed, changed, question_id]
+    ))
+
+
+def _apply_chunk(question_id: int, key: tuple, points: int, correct_json: str,
+                 rows: list[tuple]) -> int:
+    """Correct one chunk of (answer_id, test_id, user_answer, is_correct) rows"""
+    test_of = {answer_id: test_id for answer_id, test_id, _, _ in rows}
+    changed = regrade(
+        ((answer_id, question_id, json.loads(user_answer), was_correct)
+         for answer_id, _, user_answer, was_correct in rows),
+        {question_id: key}
+    )
+    with transaction() as db:
+        db.execute(
+            "UPDATE test_answers SET correct_answer = %s "
+            "WHERE question_id = %s AND id >= %s AND id <= %s",
+            (correct_json, question_id, rows[0][0], rows[-1][0])
+        )
+        if not changed:
+            return 0
+        db.executemany(
+            "UPDATE test_answers SET is_correct = %s WHERE id = %s",
+            [(correct, answer_id) for answer_id, _, correct in changed]
+        )
+        deltas: dict[int, int] = {}
+        for answer_id, _, correct in changed:
+            test_id = test_of[answer_id]
+            deltas[test_id] = deltas.get(test_id, 0) + (1 if correct else -1)
+        db.executemany(
+            "UPDATE tests SET passed = passed + %s, earned_score = earned_score + %s, "
+            "average = IF(total > 0, passed / total, 0) WHERE id = %s",
+            [(delta, delta * points, test_id) for test_id, delta in deltas.items()]
+        )
+        placeholders = ",".join(["%s"] * len(deltas))
+        owners = db.execute(
+            f"SELECT id, user_id, section, total FROM tests WHERE id IN ({placeholders})",
+            tuple(deltas)
+        )
+        per_user: dict[tuple[str, int], int] = {}
+        stats: dict[int, list] = {}
+        for test_id, user_id, section, total in owners:
+            table = 'fundamentals' if section == 'fundamentals' else 'algorithms'
+            per_user[(table, user_id)] = per_user.get((table, user_id), 0) + deltas[test_id]
+            acc = stats.setdefault(user_id, [0, 0.0])
+            acc[0] += deltas[test_id]
+            acc[1] += deltas[test_id] / total if total else 0.0
+        db.executemany(
+            ADD_RESULTS, [(user_id, passed, 0, average) for user_id, (passed, average) in stats.items()])
+        for table in ('fundamentals', 'algorithms'):
+            params = [(delta * points, delta, user_id)
+                      for (t, user_id), delta in per_user.items() if t == table and delta]
+            if params:
+                db.executemany(
+                    f"UPDATE {table} SET score = score + %s, testsPassed = testsPassed + %s "
+                    f"WHERE user_id = %s",
+                    params
+                )
+    pipe = redis_client.pipeline()
+    for (table, user_id), delta in per_user.items():
+        if delta:
+            pipe.zincrby(ranking_key(table), delta * points, str(user_id))
+    pipe.execute()
+    return len(changed)
+
+
+def _load_key(question_id: int) -> tuple[tuple, str] | None:
+    row = execute(
+        "SELECT question_type, correct_answer FROM current_questions WHERE id = %s",
+        (question_id,), fetchone=True
+    )
+    if not row:
+        return None
+    qtype, correct_json = row
+    correct = json.loads(correct_json) if correct_json else []
+    if isinstance(correct, str):
+        correct = json.loads(correct)
+    return compile_key(qtype, correct), json.dumps(correct, ensure_ascii=False)
+
+
+def run_regrade(question_id: int, chunk_size: int = CHUNK_SIZE, pause: float = 0.0,
+                progress=None) -> dict | None:
+    """Run or resume the question's job to completion.
+
+    Returns the final status, or None when another process holds the job.
+    progress, if given, is called with the status after every chunk; pause
+    sleeps between chunks to spread the load.
+    """
+    lock_key = f"lock:{_job_key(question_id)}"
+    if not redis_client.set(lock_key, 1, nx=True, ex=LOCK_TTL):
+        return None
+    job = _job_key(question_id)
+    try:
+        if not redis_client.exists(job):
+            schedule_regrade(question_id)
+        gen = None
+        answer_key = None
+        while True:
+            current, last_id, points = redis_client.hmget(job, "gen", "last_id", "points")
+            current, last_id = int(current or 0), int(last_id or 0)
+            if current != gen:
+                # first chunk, or the key changed again and the job was reset
+                gen = current
+                answer_key = _load_key(question_id)
+                if points is not None:
+                    job_points = int(points)
+                elif answer_key is not None:
+                    # job scheduled before points were recorded
+                    job_points = POINTS.get(execute(
+                        "SELECT difficulty FROM current_questions WHERE id = %s",
+                        (question_id,), fetchone=True)[0], 0)
+                if not _advance(question_id, gen, "running", last_id):
+                    continue
+            rows = execute(
+                "SELECT id, test_id, user_answer, is_correct FROM test_answers "
+                "WHERE question_id = %s AND id > %s ORDER BY id LIMIT %s",
+                (question_id, last_id, chunk_size)
+            ) if answer_key is not None else []
+            if not rows:
+                if _advance(question_id, gen, "done", last_id):
+                    break
+                continue
+            key, correct_json = answer_key
+            changed = _apply_chunk(question_id, key, job_points, correct_json, rows)
+            _advance(question_id, gen, "running", rows[-1][0], len(rows), changed)
+            redis_client.expire(lock_key, LOCK_TTL)
+            if progress:
+                progress(regrade_status(question_id))
+            if pause:
+                time.sleep(pause)
+        return regrade_status(question_id)
+    finally:
+        redis_client.delete(lock_key)
+
+
+def reschedule_stale() -> None:
+    """Restart the jobs of questions with answers written after their key changed"""
+    for member in redis_client.smembers(STALE_KEY):
+        schedule_regrade(int(member))
+        # removed after scheduling, so a crash in between only repeats the job
+        redis_client.srem(STALE_KEY, member)
+
+
+def run_pending_regrades(**kwargs) -> list[dict]:
+    """Run every scheduled or interrupted job that no other process holds"""
+    reschedule_stale()
+    results = []
+    for question_id in pending_regrades():
+        result = run_regrade(question_id, **kwargs)
+        if result is not None:
+            results.append(result)
+    return results
@@ -0,0 +1,84 @@
+import random
+from typing import Iterable
+
+
+class IdPool:
+    """Array of ids with O(1) add/remove and O(k) random sampling"""
+
+    def __init__(self, ids: Iterable[int] = ()):
+        self._ids: list[int] = []
+        self._pos: dict[int, int] = {}
+        for item in ids:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, item: int) -> bool:
+        return item in self._pos
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def add(self, item: int) -> None:
+        if item in self._pos:
+            return
+        self._pos[item] = len(self._ids)
+        self._ids.append(item)
+
+    def discard(self, item: int) -> None:
+        pos = self._pos.pop(item, None)
+        if pos is None:
+            return
+        last = self._ids.pop()
+        if pos < len(self._ids):
+            self._ids[pos] = last
+            self._pos[last] = pos
+
+    def clear(self) -> None:
+        self._ids.clear()
+        self._pos.clear()
+
+    def get(self, pos: int) -> int:
+        return self._ids[pos]
+
+    def sample(self, k: int, exclude: Iterable[int] = ()) -> list[int]:
+        return sample_pools([self], k, exclude)
+
+
+def sample_pools(pools: list[IdPool], k: int,
+                 exclude: Iterable[int] = ()) -> list[int]:
+    """Draw up to k distinct ids uniformly from the union of pools.
+
+    Random positions are drawn across the concatenated pools and rejected if
+    already taken or excluded, which costs O(k) while the pools are much
+    larger than k. When they are not, the remaining candidates are listed
+    and sampled directly.
+    """
+    exclude = set(exclude)
+    sizes = [len(p) for p in pools]
+    total = sum(sizes)
+    if k <= 0 or not total:
+        return []
+    if total < 2 * (k + len(exclude)):
+        seen = set()
+        candidates = []
+        for pool in pools:
+            for item in pool:
+                if item not in exclude and item not in seen:
+                    seen.add(item)
+                    candidates.append(item)
+        return random.sample(candidates, min(k, len(candidates)))
+    result = []
+    while len(result) < k:
+        pos = random.randrange(total)
+        for pool, size in zip(pools, sizes):
+            if pos < size:
+                item = pool.get(pos)
+                break
+            pos -= size
+        if item in exclude:
+            continue
+        exclude.add(item)
+        result.append(item)
+    return result
@@ -0,0 +1,94 @@
+from database import aexecute, atransaction, execute, transaction
+from services.test_session_service import get_pending
+
+# Per-user test statistics kept as running counters in user_stats, so the
+# stats endpoint reads one row instead of summing every test the user took.
+# tests counts every test started; passed, total and average_sum grow when a
+# submission is written (write_behind_service) and follow regrades. Until
+# then get_user_stats_async adds the submission from the pending list.
+# rebuild_user_stats recomputes every row from the tests table; run.sh runs
+# it through manage.py before starting the app when the table is missing.
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INT PRIMARY KEY,
+        tests INT NOT NULL DEFAULT 0,
+        passed INT NOT NULL DEFAULT 0,
+        total INT NOT NULL DEFAULT 0,
+        average_sum DOUBLE NOT NULL DEFAULT 0
+    )
+"""
+
+COUNT_TEST = (
+    "INSERT INTO user_stats (user_id, tests) VALUES (%s, 1) "
+    "ON DUPLICATE KEY UPDATE tests = tests + 1"
+)
+
+# params: (user_id, passed, total, average_sum) deltas
+ADD_RESULTS = (
+    "INSERT INTO user_stats (user_id, passed, total, average_sum) VALUES (%s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE passed = passed + VALUES(passed), total = total + VALUES(total), "
+    "average_sum = average_sum + VALUES(average_sum)"
+)
+
+
+def stats_table_exists() -> bool:
+    return execute("SHOW TABLES LIKE 'user_stats'", fetchone=True) is not None
+
+
+async def check_stats_table() -> None:
+    """Refuse to start without user_stats; test writes depend on it"""
+    if not await aexecute("SHOW TABLES LIKE 'user_stats'", fetchone=True):
+        raise RuntimeError("user_stats is missing; run 'python manage.py rebuild-stats'")
+
+
+async def get_user_stats_async(user_id: int) -> dict:
+    """Return test counters and section scores for a user, including
+    submissions not written to MySQL yet"""
+    pending = await get_pending(user_id)
+    # one snapshot, so a submission written meanwhile is counted exactly once
+    async with atransaction() as db:
+        row = await db.execute(
+            "SELECT s.tests, s.passed, s.total, s.average_sum, f.score, a.score "
+            "FROM users u "
+            "LEFT JOIN user_stats s ON s.user_id = u.id "
+            "LEFT JOIN fundamentals f ON f.user_id = u.id "
+            "LEFT JOIN algorithms a ON a.user_id = u.id "
+            "WHERE u.id = %s",
+            (user_id,), fetchone=True
+        )
+        unwritten = []
+        if pending:
+            placeholders = ",".join(["%s"] * len(pending))
+            rows = await db.execute(
+                f"SELECT id FROM tests WHERE id IN ({placeholders}) AND total = 0",
+                tuple(pending)
+            )
+            unwritten = [pending[r[0]] for r in rows]
+    tests, passed, total, average_sum, fundamentals, algorithms = row or (None,) * 6
+    stats = {
+        "passed": passed or 0,
+        "total": total or 0,
+        "average_sum": average_sum or 0.0,
+        "fundamentals": fundamentals or 0,
+        "algorithms": algorithms or 0
+    }
+    for s in unwritten:
+        stats["passed"] += s["passed"]
+        stats["total"] += s["total"]
+        stats["average_sum"] += s["average"]
+        stats['fundamentals' if s["section"] == 'fundamentals' else 'algorithms'] += s["earned_score"]
+    average_sum = stats.pop("average_sum")
+    return {**stats, "average": average_sum / tests if tests else 0.0}
+
+
+def rebuild_user_stats() -> int:
+    """Recompute every user's counters from the tests table, return the row count"""
+    execute(CREATE_TABLE)
+    with transaction() as db:
+        db.execute("DELETE FROM user_stats")
+        db.execute(
+            "INSERT INTO user_stats (user_id, tests, passed, total, average_sum) "
+            "SELECT user_id, COUNT(*), COALESCE(SUM(passed), 0), COALESCE(SUM(total), 0), "
+            "COALESCE(SUM(average), 0) FROM tests GROUP BY user_id"
+        )
+        return db.rowcount
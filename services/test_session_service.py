@@ -0,0 +1,107 @@
+import datetime
+import json
+from database import async_redis
+from services.cache_service import json_default
+from services.grading_service import load_snapshot
+
+# Active tests live in a Redis hash test:<id>:session from the moment their
+# questions are assigned until end_time plus SESSION_GRACE. Fields:
+#   user_id   owner of the test
+#   section   fundamentals or algorithms
+#   end_time  deadline as a unix timestamp
+#   payload   the JSON served by GET /tests/{id}/questions
+#   grading   answer keys of the test's questions as assigned, see
+#             grading_service.grading_snapshot; never overwritten
+#   result    the submission summary, once the test was submitted
+# MySQL stays the system of record. The hash serves reads and deadline
+# checks, and setting its result field is what makes a submission final;
+# the rows themselves reach MySQL through services.write_behind_service.
+SESSION_GRACE = 600
+
+# Submissions accepted but not yet written to MySQL are also kept per user in
+# a hash writes:pending:<user_id>, test_id -> the queued submission. It is
+# filled together with the write-behind stream and cleared by the worker once
+# the rows are committed; readers of test results overlay it on MySQL.
+
+
+def session_key(test_id: int) -> str:
+    return f"test:{test_id}:session"
+
+
+def pending_key(user_id: int) -> str:
+    return f"writes:pending:{user_id}"
+
+
+async def get_pending(user_id: int) -> dict[int, dict]:
+    """Return the user's submissions still waiting to be written, by test id"""
+    raw = await async_redis.hgetall(pending_key(user_id))
+    return {int(test_id): json.loads(data) for test_id, data in raw.items()}
+
+
+async def open_session(test_id: int, user_id: int, section: str, end_time: datetime.datetime,
+                       payload: dict, grading: list[dict], result: dict | None = None) -> None:
+    """Store or refresh a test's session, expiring SESSION_GRACE after end_time"""
+    key = session_key(test_id)
+    fields = {
+        "user_id": user_id,
+        "section": section,
+        "end_time": end_time.timestamp(),
+        "payload": json.dumps(payload, default=json_default)
+    }
+    if result is not None:
+        fields["result"] = json.dumps(result, default=json_default)
+    pipe = async_redis.pipeline()
+    pipe.hset(key, mapping=fields)
+    pipe.hsetnx(key, "grading", json.dumps(grading))
+    pipe.expireat(key, int(end_time.timestamp()) + SESSION_GRACE)
+    await pipe.execute()
+
+
+async def get_session(test_id: int) -> dict | None:
+    raw = await async_redis.hgetall(session_key(test_id))
+    fields = {k.decode(): v for k, v in raw.items()}
+    if "user_id" not in fields:
+        return None
+    return {
+        "user_id": int(fields["user_id"]),
+        "section": fields["section"].decode(),
+        "end_time": float(fields["end_time"]),
+        "payload": json.loads(fields["payload"]) if "payload" in fields else None,
+        "grading": load_snapshot(json.loads(fields["grading"])) if "grading" in fields else None,
+        "result": json.loads(fields["result"]) if "result" in fields else None
+    }
+
+
+async def save_result(test_id: int, result: dict) -> dict | None:
+    """Record the result of a test unless one is already recorded.
+
+    Returns None when this call recorded it, otherwise the earlier result,
+    so concurrent submissions of one test resolve to a single winner. Only
+    the result field is written; finalize_result closes the session once
+    the submission is queued.
+    """
+    key = session_key(test_id)
+    pipe = async_redis.pipeline()
+    pipe.hsetnx(key, "result", json.dumps(result, default=json_default))
+    pipe.hget(key, "result")
+    created, stored = await pipe.execute()
+    return None if created else json.loads(stored)
+
+
+async def finalize_result(test_id: int, user_id: int, section: str,
+                          result: dict, payload: dict | None = None) -> None:
+    """Close the session of a queued submission; the payload, if given, is
+    updated with the new totals"""
+    key = session_key(test_id)
+    fields = {"user_id": user_id, "section": section, "end_time": 0}
+    if payload is not None:
+        fields["payload"] = json.dumps({**payload, **result}, default=json_default)
+    pipe = async_redis.pipeline()
+    pipe.hset(key, mapping=fields)
+    pipe.expire(key, SESSION_GRACE)
+    await pipe.execute()
+
+
+async def discard_result(test_id: int) -> None:
+    """Undo save_result when the submission could not be queued"""
+    await async_redis.hdel(session_key(test_id), "result")
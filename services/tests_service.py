@@ -1,206 +1,124 @@
 from fastapi import HTTPException
-from database import execute
-from services.user_service import save_user_test, get_user_scores
+from database import aexecute, asession, atransaction, AsyncSession
+from services.user_service import save_user_test_async
 import datetime
 import json
+import math
 import random
 import asyncio
+import time
 from services.achievement_service import check_and_award
+from services.leaderboard_service import get_ranked_scores, ranking_key
+from services.test_session_service import (
+    open_session, get_session, get_pending, save_result, finalize_result, discard_result
+)
+from services.write_behind_service import enqueue_submission
+from services.grading_service import POINTS, grade_submission, grading_snapshot
+from services.question_bank import get_questions, sample_ids
+from services.topic_service import leaf_labels, resolve_topic_ids, resolve_topic_labels
 from typing import Optional
 
 
-def start_test(user_id: int, section: str, labels: list[str]) -> int:
-    if labels:
-        placeholders = ",".join(["%s"] * len(labels))
-        rows = execute(
-            f"SELECT id FROM topics WHERE label IN ({placeholders})",
-            tuple(labels))
-        topic_ids = [r[0] for r in rows]
-    else:
-        topic_ids = []
+def _public_question(q: dict) -> dict:
+    """Copy a cached question without its answer key"""
+    return {
+        "id": q["id"],
+        "question_text": q["question_text"],
+        "question_type": q["question_type"],
+        "difficulty": q["difficulty"],
+        "options": list(q["options"])
+    }
+
+
+async def start_test(user_id: int, section: str, labels: list[str]) -> int:
     section_map = {"FI": "fundamentals", "AS": "algorithms"}
     db_section = section_map.get(section)
     if not db_section:
         raise HTTPException(
             status_code=400, detail={
                 "code": "invalid_section"})
-    save_user_test(user_id, "practice", db_section, 0, 0, topic_ids)
-    row = execute(
-        "SELECT id FROM tests WHERE user_id = %s ORDER BY created_at DESC LIMIT 1",
-        (user_id,), fetchone=True
-    )
-    test_id = row[0]
-    get_test_questions(user_id, test_id)
+    topic_ids = resolve_topic_ids(labels) if labels else []
+    # the tests row, its user_stats count and the question assignment commit together
+    async with atransaction() as db:
+        test_id = await save_user_test_async(user_id, "practice", db_section, 0, 0, topic_ids, db=db)
+        await _get_test_questions(db, user_id, test_id)
     return test_id
 
 
-def get_test_questions(user_id: int, test_id: int) -> dict:
-    row = execute(
-        "SELECT topics, questions, created_at FROM tests WHERE id = %s AND user_id = %s",
-        (test_id, user_id), fetchone=True
-    )
+MOSCOW_TZ = datetime.timezone(datetime.timedelta(hours=3))
+# submissions arriving this many seconds after end_time are still accepted,
+# so a client auto-submitting when its timer runs out is not cut off by
+# network latency or clock skew
+SUBMIT_GRACE = 30
+
+_TEST_ROW_QUERY = (
+    "SELECT topics, questions, created_at, end_time, passed, total, average, earned_score, section "
+    "FROM tests WHERE id = %s AND user_id = %s"
+)
+
+
+def _shuffled(questions: list[dict], test_id: int) -> list[dict]:
+    """Strip answer keys and shuffle options, the same way for every request of a test"""
+    rng = random.Random(test_id)
+    result = []
+    for q in questions:
+        public = _public_question(q)
+        rng.shuffle(public["options"])
+        result.append(public)
+    return result
+
+
+async def get_test_questions(user_id: int, test_id: int) -> dict:
+    test_session = await get_session(test_id)
+    if test_session is not None and test_session["payload"] is not None:
+        if test_session["user_id"] != user_id:
+            raise HTTPException(status_code=404, detail={"code": "test_not_found"})
+        return test_session["payload"]
+    async with asession() as db:
+        return await _get_test_questions(db, user_id, test_id)
+
+
+async def _get_test_questions(db: AsyncSession, user_id: int, test_id: int) -> dict:
+    row = await db.execute(_TEST_ROW_QUERY, (test_id, user_id), fetchone=True)
     if not row:
         raise HTTPException(status_code=404, detail={"code": "test_not_found"})
-    topic_ids = json.loads(row[0]) or []
-    questions_json = row[1]
-    created_at = row[2]
+    topics_json, questions_json, created_at, end_time, passed, total, average, earned_score, section = row
+    topic_ids = (json.loads(topics_json) if topics_json else None) or []
     question_ids = json.loads(questions_json) if questions_json else []
     if question_ids:
-        placeholders = ",".join(["%s"] * len(question_ids))
-        rows = execute(
-            f"SELECT id, question_text, question_type, difficulty, options "
-            f"FROM current_questions WHERE id IN ({placeholders})",
-            tuple(question_ids)
-        )
-        id_to_row = {r[0]: r for r in rows}
-        questions = []
-        for qid in question_ids:
-            r = id_to_row.get(qid)
-            if r:
-                questions.append({
-                    "id": r[0],
-                    "question_text": r[1], "question_type": r[2], "difficulty": r[3],
-                    "options": json.loads(r[4]) if r[4] else []
-                })
-        for q in questions:
-            random.shuffle(q["options"])
-        # load topics labels
-        topics = []
+        questions = get_questions(question_ids)
+        end_time = end_time or created_at
+        if end_time.tzinfo is None:
+            end_time = end_time.replace(tzinfo=MOSCOW_TZ)
+    else:
+        # select exactly 10 questions
         if topic_ids:
-            placeholders = ",".join(["%s"] * len(topic_ids))
-            topic_labels_rows = execute(
-                f"SELECT label FROM topics WHERE id IN ({placeholders})",
-                tuple(topic_ids)
-            )
-            topics = [r[0] for r in topic_labels_rows]
-        # load test metadata
-        end_time_row = execute(
-            "SELECT end_time, passed, total, average, earned_score, section, created_at "
-            "FROM tests WHERE id = %s",
-            (test_id,), fetchone=True
-        )
-        if end_time_row and end_time_row[0] is not None:
-            end_time, passed, total, average, earned_score, section, created_at_db = end_time_row
+            labels = leaf_labels(topic_ids)
+            if not labels:
+                raise HTTPException(
+                    status_code=404,
+                    detail={"code": "no_topics_found"}
+                )
+            selected = sample_ids(labels, 10)
         else:
-            end_time = created_at
-            passed = total = average = earned_score = 0
-            section = ""
-            created_at_db = created_at
-        return {
-            "questions": questions,
-            "end_time": end_time,
-            "start_time": created_at,
-            "id": test_id,
-            "type": "custom",
-            "section": section or "",
-            "passed": passed,
-            "total": total,
-            "average": average,
-            "topics": topics,
-            "created_at": (
-                created_at_db.isoformat()
-                if created_at_db else datetime.datetime.now(datetime.timezone.utc).isoformat()
-            ),
-            "earned_score": earned_score
-        }
-    # select exactly 10 questions
-    if topic_ids:
-        placeholders = ",".join(["%s"] * len(topic_ids))
-        label_rows = execute(
-            f"SELECT label FROM topics WHERE id IN ({placeholders})",
-            tuple(topic_ids)
-        )
-        labels = [r[0] for r in label_rows]
-        if not labels:
-            raise HTTPException(
-                status_code=404,
-                detail={"code": "no_topics_found"}
-            )
-        placeholders2 = ",".join(["%s"] * len(labels))
-        all_topic_qs = execute(
-            f"SELECT id, question_text, question_type, difficulty, options "
-            f"FROM current_questions WHERE topic_code IN ({placeholders2})",
-            tuple(labels)
+            selected = sample_ids(None, 10)
+        questions = get_questions(selected)
+        difficulty_map = {"easy": 1, "medium": 2, "hard": 5}
+        total_minutes = sum(
+            difficulty_map.get(q["difficulty"], 1)
+            for q in questions
         )
-        if len(all_topic_qs) >= 10:
-            rows = random.sample(all_topic_qs, 10)
-        else:
-            selected = list(all_topic_qs)
-            needed = 10 - len(selected)
-            if selected:
-                excl_ph = ",".join(["%s"] * len(selected))
-                more = execute(
-                    f"SELECT id, question_text, question_type, difficulty, options "
-                    f"FROM current_questions WHERE id NOT IN ({excl_ph}) "
-                    "ORDER BY RAND() LIMIT %s",
-                    tuple([q[0] for q in selected]) + (needed,)
-                )
-            else:
-                more = execute(
-                    "SELECT id, question_text, question_type, difficulty, options "
-                    "FROM current_questions ORDER BY RAND() LIMIT %s",
-                    (needed,)
-                )
-            rows = selected + list(more)
-    else:
-        rows = execute(
-            "SELECT id, question_text, question_type, difficulty, options "
-            "FROM current_questions ORDER BY RAND() LIMIT 10"
+        end_time = datetime.datetime.now(MOSCOW_TZ) + datetime.timedelta(minutes=total_minutes)
+        await db.execute(
+            "UPDATE tests SET questions = %s, end_time = %s "
+            "WHERE id = %s AND (questions IS NULL OR questions IN ('', '[]'))",
+            (json.dumps([q["id"] for q in questions]), end_time, test_id)
         )
-    questions = []
-    for q_id, text, qtype, diff, opts_json in rows:
-        questions.append({
-            "id": q_id,
-            "question_text": text,
-            "question_type": qtype,
-            "difficulty": diff,
-            "options": json.loads(opts_json) if opts_json else []
-        })
-    for q in questions:
-        random.shuffle(q["options"])
-    difficulty_map = {"easy": 1, "medium": 2, "hard": 5}
-    total_minutes = sum(
-        difficulty_map.get(q["difficulty"], 1)
-        for q in questions
-    )
-    moscow_tz = datetime.timezone(datetime.timedelta(hours=3))
-    end_time = datetime.datetime.now(
-        moscow_tz) + datetime.timedelta(minutes=total_minutes)
-    # record questions and end_time into DB
-    question_ids = [q["id"] for q in questions]
-    execute(
-        "UPDATE tests SET questions = %s WHERE id = %s",
-        (json.dumps(question_ids), test_id)
-    )
-    execute(
-        "UPDATE tests SET end_time = %s WHERE id = %s",
-        (end_time, test_id)
-    )
-    test_row = execute(
-        "SELECT passed, total, average, earned_score, section, created_at, topics FROM tests WHERE id = %s",
-        (test_id,), fetchone=True)
-    if test_row:
-        passed, total, average, earned_score, section, created_at_db, topics_json = test_row
-    else:
-        passed = total = average = earned_score = 0
-        section = ""
-        created_at_db = created_at
-        topics_json = None
-    if topics_json:
-        topic_ids_db = json.loads(topics_json) or []
-        if topic_ids_db:
-            placeholders = ",".join(["%s"] * len(topic_ids_db))
-            topic_labels_rows = execute(
-                f"SELECT label FROM topics WHERE id IN ({placeholders})",
-                tuple(topic_ids_db)
-            )
-            topics = [r[0] for r in topic_labels_rows]
-        else:
-            topics = []
-    else:
-        topics = []
-    return {
-        "questions": questions,
+        if not db.rowcount:
+            # a concurrent request assigned the questions first
+            return await _get_test_questions(db, user_id, test_id)
+    payload = {
+        "questions": _shuffled(questions, test_id),
         "end_time": end_time,
         "start_time": created_at,
         "id": test_id,
@@ -209,49 +127,62 @@ def get_test_questions(user_id: int, test_id: int) -> dict:
         "passed": passed,
         "total": total,
         "average": average,
-        "topics": topics,
+        "topics": resolve_topic_labels(topic_ids),
         "created_at": (
-            created_at_db.isoformat()
-            if created_at_db else datetime.datetime.now(datetime.timezone.utc).isoformat()
+            created_at.isoformat()
+            if created_at else datetime.datetime.now(datetime.timezone.utc).isoformat()
         ),
         "earned_score": earned_score
     }
+    result = {"passed": passed, "total": total, "average": average,
+              "earned_score": earned_score} if total else None
+    await open_session(test_id, user_id, section, end_time, payload, grading_snapshot(questions), result)
+    return payload
 
 
-def submit_test(user_id: int, test_id: int, answers: list[dict]) -> dict:
-    row = execute(
-        "SELECT user_id, section, end_time FROM tests WHERE id = %s",
-        (test_id,), fetchone=True
-    )
-    if not row:
-        raise HTTPException(status_code=404, detail={"code": "test_not_found"})
-    if row[0] != user_id:
+async def _submission_state(user_id: int, test_id: int) -> dict:
+    """Return the test's session, rebuilt from the tests row if Redis lost it"""
+    test_session = await get_session(test_id)
+    if test_session is None:
+        row = await aexecute(
+            "SELECT user_id, section, end_time, passed, total, average, earned_score "
+            "FROM tests WHERE id = %s",
+            (test_id,), fetchone=True
+        )
+        if not row:
+            raise HTTPException(status_code=404, detail={"code": "test_not_found"})
+        user, section, end_time, passed, total, average, earned_score = row
+        test_session = {
+            "user_id": user, "section": section, "payload": None, "grading": None, "result": None,
+            "end_time": end_time.replace(tzinfo=MOSCOW_TZ).timestamp() if end_time else math.inf
+        }
+        if total:
+            test_session["result"] = {"passed": passed, "total": total,
+                                      "average": average, "earned_score": earned_score}
+    if test_session["user_id"] != user_id:
         raise HTTPException(status_code=403, detail={"code": "forbidden"})
-    section = row[1]
-    end_time = row[2]
-    now = datetime.datetime.now(datetime.timezone.utc)
-    if end_time and now > end_time.replace(tzinfo=datetime.timezone.utc):
-        test_row = execute(
-            "SELECT passed, total, average, earned_score FROM tests WHERE id = %s",
-            (test_id,), fetchone=True)
-        if test_row:
-            passed, total, average, earned_score = test_row
-        else:
-            passed = total = average = earned_score = 0
-        return {"passed": passed, "total": total,
-                "average": average, "earned_score": earned_score}
+    return test_session
+
+
+async def submit_test(user_id: int, test_id: int, answers: list[dict]) -> dict:
+    test_session = await _submission_state(user_id, test_id)
+    if test_session["result"] is not None:
+        return test_session["result"]
+    if time.time() > test_session["end_time"] + SUBMIT_GRACE:
+        # past the deadline and never submitted: the row still holds its initial zeros
+        return {"passed": 0, "total": 0, "average": 0.0, "earned_score": 0}
     submitted = {ans.question_id: ans.answer for ans in answers}
     if not submitted:
         raise HTTPException(
             status_code=400, detail={
                 "code": "no_answers_provided"})
-    placeholders = ",".join(["%s"] * len(submitted))
-    rows = execute(
-        f"SELECT id, correct_answer, difficulty, question_type "
-        f"FROM current_questions WHERE id IN ({placeholders})",
-        tuple(submitted.keys())
-    )
-    qtype_map = {r[0]: r[3] for r in rows}
+    if test_session["grading"] is not None:
+        # keys as they were when the questions were assigned
+        grading = test_session["grading"]
+        questions = [grading[qid] for qid in submitted if qid in grading]
+    else:
+        questions = get_questions(list(submitted))
+    qtype_map = {q["id"]: q["question_type"] for q in questions}
     for qid, ans_list in submitted.items():
         qtype = qtype_map.get(qid)
         if qtype == 'open-ended':
@@ -267,114 +198,76 @@ def submit_test(user_id: int, test_id: int, answers: list[dict]) -> dict:
             if any(len(item) > 256 for item in ans_list):
                 raise HTTPException(
                     status_code=400, detail={"code": "answer_item_too_long"})
-    passed = 0
-    weighted_score = 0
-    weight_map = {"easy": 1, "medium": 2, "hard": 5}
-    correct_answers = []
-    user_answers_list = []
-    for i, (qid, correct_json, difficulty, question_type) in enumerate(rows):
-        correct_val = json.loads(correct_json)
-        user_ans = submitted[qid]
-        if question_type == 'multiple-choice' and len(correct_val) > 1:
-            norm_c = sorted(str(c).strip().lower() for c in correct_val)
-            norm_u = sorted(str(a).strip().lower() for a in user_ans)
-            is_correct = norm_c == norm_u
-        else:
-            is_correct = len(user_ans) == len(correct_val) and all(
-                str(c).strip().lower() == str(a).strip().lower()
-                for c, a in zip(correct_val, user_ans)
-            )
-        if is_correct:
-            passed += 1
-            weighted_score += weight_map.get(difficulty, 0)
-
-        correct_answers.append({
-            "question_id": qid,
-            "correct_answer": correct_val
-        })
-        user_answers_list.append({
-            "question_id": qid,
-            "user_answer": submitted[qid],
-            "is_correct": is_correct
-        })
+    graded = grade_submission(questions, submitted)
+    passed = graded["passed"]
+    weighted_score = graded["earned_score"]
+    answer_rows = graded["answers"]
+    correct_answers = [{"question_id": qid, "correct_answer": correct}
+                       for qid, _, correct, _ in answer_rows]
+    user_answers_list = [{"question_id": qid, "user_answer": user_answer, "is_correct": ok}
+                         for qid, user_answer, _, ok in answer_rows]
     total = len(answers)
     average = passed / total if total else 0.0
-    execute(
-        "UPDATE tests SET passed = %s, total = %s, average = %s, earned_score = %s WHERE id = %s",
-        (passed, total, average, weighted_score, test_id)
-    )
-    now = datetime.datetime.now(datetime.timezone.utc)
+    section = test_session["section"]
+    result = {"passed": passed, "total": total,
+              "average": average, "earned_score": weighted_score}
+    earlier = await save_result(test_id, result)
+    if earlier is not None:
+        return earlier
     table = 'fundamentals' if section == 'fundamentals' else 'algorithms'
-    execute(
-        f"UPDATE {table} SET score = score + %s, "
-        f"testsPassed = testsPassed + %s, "
-        f"totalTests = totalTests + %s, "
-        f"lastActivity = %s WHERE user_id = %s",
-        (weighted_score, passed, total, now, user_id)
-    )
-    moscow_tz = datetime.timezone(datetime.timedelta(hours=3))
-    now_moscow = datetime.datetime.now(moscow_tz)
-    execute("UPDATE tests SET end_time = %s WHERE id = %s", (now_moscow, test_id))
-    for ans in user_answers_list:
-        usr_json = json.dumps(ans["user_answer"], ensure_ascii=False)
-        corr_val = next(c["correct_answer"]
-                        for c in correct_answers if c["question_id"] == ans["question_id"])
-        corr_json = json.dumps(corr_val, ensure_ascii=False)
-        execute(
-            "INSERT INTO test_answers (test_id, question_id, user_answer, correct_answer, is_correct) "
-            "VALUES (%s, %s, %s, %s, %s)",
-            (test_id, ans["question_id"], usr_json,
-             corr_json, ans["is_correct"])
-        )
     try:
-        scores = get_user_scores(user_id)
-        total_score = scores.get('fundamentals', 0) + \
-            scores.get('algorithms', 0)
-        loop = None
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            pass
-        if loop and loop.is_running():
-            loop.create_task(
-                asyncio.to_thread(
-                    check_and_award,
-                    user_id,
-                    tests_passed=total_score))
-        else:
-            import threading
-            threading.Thread(target=check_and_award, args=(user_id,), kwargs={
-                             "tests_passed": total_score}, daemon=True).start()
+        await enqueue_submission({
+            "test_id": test_id, "user_id": user_id, "section": section,
+            **result, "submitted_at": time.time(), "answers": answer_rows
+        }, ranking_key(table))
+    except Exception:
+        await discard_result(test_id)
+        raise
+    await finalize_result(test_id, user_id, section, result, test_session["payload"])
+    try:
+        scores = await get_ranked_scores(user_id)
+        asyncio.get_running_loop().create_task(
+            asyncio.to_thread(
+                check_and_award,
+                user_id,
+                tests_passed=sum(scores.values())))
     except Exception:
         pass
     return {
-        "passed": passed,
-        "total": total,
-        "average": average,
-        "earned_score": weighted_score,
+        **result,
         "correct_answers": correct_answers,
         "user_answers": user_answers_list
     }
 
 
 # Add retrieval of stored answers for a test
-def get_test_answers(user_id: int, test_id: int) -> dict:
-    row = execute(
-        "SELECT user_id FROM tests WHERE id = %s",
-        (test_id,), fetchone=True
-    )
-    if not row:
-        raise HTTPException(status_code=404, detail={"code": "test_not_found"})
-    if row[0] != user_id:
-        raise HTTPException(status_code=403, detail={"code": "forbidden"})
-    rows = execute(
-        "SELECT ta.question_id, ta.correct_answer, ta.user_answer, ta.is_correct, cq.question_type, cq.difficulty "
-        "FROM test_answers ta "
-        "JOIN current_questions cq ON ta.question_id = cq.id "
-        "WHERE ta.test_id = %s ORDER BY ta.id",
-        (test_id,)
-    )
-    weight_map = {"easy": 1, "medium": 2, "hard": 5}
+async def get_test_answers(user_id: int, test_id: int) -> dict:
+    # read before MySQL: the worker commits the rows before clearing the entry
+    pending = (await get_pending(user_id)).get(test_id)
+    async with asession() as db:
+        row = await db.execute(
+            "SELECT user_id FROM tests WHERE id = %s",
+            (test_id,), fetchone=True
+        )
+        if not row:
+            raise HTTPException(status_code=404, detail={"code": "test_not_found"})
+        if row[0] != user_id:
+            raise HTTPException(status_code=403, detail={"code": "forbidden"})
+        rows = await db.execute(
+            "SELECT ta.question_id, ta.correct_answer, ta.user_answer, ta.is_correct, cq.question_type, cq.difficulty "
+            "FROM test_answers ta "
+            "JOIN current_questions cq ON ta.question_id = cq.id "
+            "WHERE ta.test_id = %s ORDER BY ta.id",
+            (test_id,)
+        )
+    if rows:
+        rows = [(qid, json.loads(corr), json.loads(ua), ic, qtype, diff)
+                for qid, corr, ua, ic, qtype, diff in rows]
+    elif pending:
+        # submitted but not written yet
+        questions = {q["id"]: q for q in get_questions([a[0] for a in pending["answers"]])}
+        rows = [(qid, corr, ua, ic, questions[qid]["question_type"], questions[qid]["difficulty"])
+                for qid, ua, corr, ic in pending["answers"] if qid in questions]
     answer_list = []
     for qid, corr, ua, ic, qtype, diff in rows:
         is_correct = bool(ic)
@@ -382,33 +275,34 @@ def get_test_answers(user_id: int, test_id: int) -> dict:
             "question_id": qid,
             "question_type": qtype,
             "difficulty": diff,
-            "user_answer": json.loads(ua),
-            "correct_answer": json.loads(corr),
+            "user_answer": ua,
+            "correct_answer": corr,
             "is_correct": is_correct,
-            "points_awarded": weight_map.get(diff, 0) if is_correct else 0
+            "points_awarded": POINTS.get(diff, 0) if is_correct else 0
         })
     return {"answers": answer_list}
 
 
-def save_question_feedback(user_id: int, test_id: int, question_id: int,
-                           rating: int, feedback_message: Optional[str] = None) -> None:
-    row = execute(
-        "SELECT id FROM tests WHERE id = %s",
-        (test_id,), fetchone=True
-    )
-    if not row:
-        raise HTTPException(status_code=404, detail={"code": "test_not_found"})
-    if not (1 <= rating <= 5):
-        raise HTTPException(status_code=400, detail={"code": "invalid_rating"})
-    now = datetime.datetime.now(datetime.timezone.utc)
-    exists = execute(
-        "SELECT id FROM current_questions WHERE id = %s",
-        (question_id,), fetchone=True
-    )
-    if not exists:
-        raise HTTPException(status_code=404, detail={"code": "question_not_found"})
-    execute(
-        "INSERT INTO questions_feedback (question_id, user_id, rating, feedback_message, created_at) "
-        "VALUES (%s, %s, %s, %s, %s)",
-        (question_id, user_id, rating, feedback_message, now)
-    )
+async def save_question_feedback(user_id: int, test_id: int, question_id: int,
+                                 rating: int, feedback_message: Optional[str] = None) -> None:
+    async with asession() as db:
+        row = await db.execute(
+            "SELECT id FROM tests WHERE id = %s",
+            (test_id,), fetchone=True
+        )
+        if not row:
+            raise HTTPException(status_code=404, detail={"code": "test_not_found"})
+        if not (1 <= rating <= 5):
+            raise HTTPException(status_code=400, detail={"code": "invalid_rating"})
+        now = datetime.datetime.now(datetime.timezone.utc)
+        exists = await db.execute(
+            "SELECT id FROM current_questions WHERE id = %s",
+            (question_id,), fetchone=True
+        )
+        if not exists:
+            raise HTTPException(status_code=404, detail={"code": "question_not_found"})
+        await db.execute(
+            "INSERT INTO questions_feedback (question_id, user_id, rating, feedback_message, created_at) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            (question_id, user_id, rating, feedback_message, now)
+        )
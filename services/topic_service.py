@@ -0,0 +1,131 @@
+import hashlib
+import json
+import random
+from typing import NamedTuple
+from database import execute, redis_client
+from services.cache_service import VersionedSnapshot
+
+# In-process dictionary of the topics table: id <-> label <-> section and the
+# leaf topics under each node. Topics change rarely and only by hand, so
+# every worker keeps the whole table with a parent -> children adjacency
+# list and reloads it when the version in Redis moves. Readers get an
+# immutable _Topics snapshot; a reload builds a new one.
+VERSION_KEY = "topics:version"
+# how often a worker asks Redis for a newer version, in seconds
+SYNC_INTERVAL = 1.0
+
+
+class _Topics(NamedTuple):
+    by_id: dict[int, dict]
+    id_by_label: dict[str, int]
+    children: dict[int | None, list[int]]
+    leaves: dict[int, list[str]]
+    # pre-encoded /topics responses: section -> {"body", "etag"}, None for all
+    trees: dict[str | None, dict]
+
+
+def _rendered(value) -> dict:
+    body = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+    return {'body': body, 'etag': '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'}
+
+
+def _build_tree(topics: _Topics, section: str, parent_id: int | None) -> list:
+    result = []
+    for child_id in topics.children.get(parent_id, ()):
+        child = topics.by_id[child_id]
+        if child['section'] != section:
+            continue
+        if any(topics.by_id[g]['section'] == section for g in topics.children.get(child_id, ())):
+            result.append({
+                "label": child['label'],
+                "accordions": _build_tree(topics, section, child_id)
+            })
+        else:
+            result.append(child['label'])
+    return result
+
+
+def _collect_leaves(topics: _Topics, topic_id: int) -> list[str]:
+    if topic_id not in topics.leaves:
+        children = topics.children.get(topic_id)
+        if children:
+            topics.leaves[topic_id] = [
+                label for child in children for label in _collect_leaves(topics, child)]
+        else:
+            topics.leaves[topic_id] = [topics.by_id[topic_id]['label']]
+    return topics.leaves[topic_id]
+
+
+def _load(previous: _Topics | None, previous_version: int | None, version: int) -> _Topics:
+    rows = execute("SELECT id, label, code, section, parent_id FROM topics ORDER BY id")
+    topics = _Topics({}, {}, {}, {}, {})
+    sections = []
+    for row in rows:
+        topic = dict(zip(['id', 'label', 'code', 'section', 'parent_id'], row))
+        topics.by_id[topic['id']] = topic
+        topics.id_by_label.setdefault(topic['label'], topic['id'])
+        topics.children.setdefault(topic['parent_id'], []).append(topic['id'])
+        if topic['section'] not in sections:
+            sections.append(topic['section'])
+    for topic_id in topics.by_id:
+        _collect_leaves(topics, topic_id)
+    trees = [{"label": section, "accordions": _build_tree(topics, section, None)} for section in sections]
+    topics.trees[None] = _rendered(trees)
+    for tree in trees:
+        topics.trees[tree['label']] = _rendered(tree)
+    return topics
+
+
+_topics = VersionedSnapshot(VERSION_KEY, _load, SYNC_INTERVAL)
+
+
+def preload() -> None:
+    """Load the topics now; blocks, so call it off the event loop"""
+    _topics.refresh()
+
+
+def bump_version() -> int:
+    """Make every worker reload the topics table"""
+    version = redis_client.incr(VERSION_KEY)
+    _topics.expire()
+    return version
+
+
+def topic_tree(section: str | None = None) -> dict | None:
+    """Return the encoded topic tree of a section, or of all sections"""
+    return _topics.get().trees.get(section)
+
+
+def resolve_topic_ids(labels: list[str]) -> list[int]:
+    """Return the ids of the given topic labels, skipping unknown ones"""
+    id_by_label = _topics.get().id_by_label
+    return [id_by_label[label] for label in dict.fromkeys(labels) if label in id_by_label]
+
+
+def resolve_topic_labels(ids: list[int]) -> list[str]:
+    """Return the labels of the given topic ids, skipping unknown ones"""
+    by_id = _topics.get().by_id
+    return [by_id[tid]['label'] for tid in dict.fromkeys(ids) if tid in by_id]
+
+
+def topic_label_map(ids) -> dict[int, str]:
+    by_id = _topics.get().by_id
+    return {tid: by_id[tid]['label'] for tid in ids if tid in by_id}
+
+
+def leaf_labels(ids: list[int]) -> list[str]:
+    """Return the labels of the leaf topics under the given topics.
+
+    A leaf stands for itself, so a selection of leaves maps to its labels.
+    """
+    all_leaves = _topics.get().leaves
+    leaves = (label for tid in ids if tid in all_leaves for label in all_leaves[tid])
+    return list(dict.fromkeys(leaves))
+
+
+def random_topic_labels(count: int, exclude=()) -> list[str]:
+    """Draw up to count distinct topic labels that are not in exclude"""
+    if count <= 0:
+        return []
+    labels = [label for label in _topics.get().id_by_label if label not in exclude]
+    return random.sample(labels, min(count, len(labels)))
@@ -1,7 +1,17 @@
 import time
-from database import execute
+from typing import Any
+from contextlib import contextmanager
+from contextvars import ContextVar
+from database import redis_client
+from database import execute, session, transaction
+from database import aexecute, asession, atransaction, AsyncSession
 import json
-from security import hash_password
+from services.password_service import hash_password
+from services.leaderboard_service import add_user, remove_user
+from services.topic_service import topic_label_map
+from services.stats_service import COUNT_TEST
+from services.test_session_service import get_pending
+from services.cache_service import cache_get_many, cache_set_many, acache_get_many, acache_set_many
 
 
 # CRUD operations for users
@@ -12,120 +22,249 @@ def save_user(email: str, password: str, username: str,
         INSERT INTO users(email, password, username, verified, verification_code)
         VALUES (%s, %s, %s, %s, %s)
     """
-    execute(
-        insert_user,
-        (email,
-         password,
-         username,
-         verified,
-         verification_code))
-    user = get_user_by_email(email)
-    if not user:
-        return 'Error: user not created'
-    now = time.strftime("%Y-%m-%d %H:%M:%S")
-    execute(
-        """
-        INSERT INTO fundamentals(user_id, score, testsPassed, totalTests, lastActivity)
-        VALUES (%s, %s, %s, %s, %s)
-        """,
-        (user['id'], 0, 0, 0, now)
-    )
-    execute(
-        """
-        INSERT INTO algorithms(user_id, score, testsPassed, totalTests, lastActivity)
-        VALUES (%s, %s, %s, %s, %s)
-        """,
-        (user['id'], 0, 0, 0, now)
-    )
+    with transaction() as db:
+        user_id = db.insert(
+            insert_user,
+            (email,
+             password,
+             username,
+             verified,
+             verification_code))
+        if not user_id:
+            return 'Error: user not created'
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        db.execute(
+            """
+            INSERT INTO fundamentals(user_id, score, testsPassed, totalTests, lastActivity)
+            VALUES (%s, %s, %s, %s, %s)
+            """,
+            (user_id, 0, 0, 0, now)
+        )
+        db.execute(
+            """
+            INSERT INTO algorithms(user_id, score, testsPassed, totalTests, lastActivity)
+            VALUES (%s, %s, %s, %s, %s)
+            """,
+            (user_id, 0, 0, 0, now)
+        )
+    _forget()
+    add_user(user_id)
     return 0
 
 
-def change_db_users(email: str, *updates: tuple[str, any]) -> str:
-    valid = [
-        'password',
-        'username',
-        'email',
-        'achievement',
-        'avatar',
-        'verified',
-        'verification_code',
-        'telegram',
-        'github',
-        'website',
-        'bio',
-        'refresh_token'
-    ]
-    for column, value in updates:
-        if column not in valid:
-            return f"Error: invalid column {column}"
-        if column == 'password':
-            value = hash_password(value)
-        execute(
-            f"UPDATE users SET {column} = %s WHERE email = %s", (value, email))
+_WRITABLE_COLUMNS = frozenset([
+    'password',
+    'username',
+    'email',
+    'achievement',
+    'avatar',
+    'verified',
+    'verification_code',
+    'telegram',
+    'github',
+    'website',
+    'bio',
+    'refresh_token'
+])
+
+
+def _check_columns(columns) -> None:
+    for column in columns:
+        if column not in _WRITABLE_COLUMNS:
+            raise ValueError(f"invalid column {column}")
+
+
+def update_user(email: str, values: dict[str, Any]) -> int:
+    """Set the given columns of the user with this email in one UPDATE.
+
+    Raises ValueError for a column outside the whitelist. A password must
+    already be hashed. Returns the number of rows changed.
+    """
+    _check_columns(values)
+    if not values:
+        return 0
+    assignments = ", ".join(f"{column} = %s" for column in values)
+    # the cache keys to drop; usually memoized by the request that loaded the user
+    old = load_user("email", email)
+    with session() as db:
+        db.execute(
+            f"UPDATE users SET {assignments} WHERE email = %s",
+            (*values.values(), email)
+        )
+        changed = db.rowcount
+    _invalidate(old)
+    return changed
+
+
+def change_db_users(email: str, *updates: tuple[str, Any]) -> str:
+    """update_user for (column, value) pairs, hashing a plain password"""
+    values = dict(updates)
+    try:
+        _check_columns(values)
+    except ValueError as e:
+        return f"Error: {e}"
+    if 'password' in values:
+        values['password'] = hash_password(values['password'])
+    update_user(email, values)
     return 'success'
 
 
-def get_user_by_email(email: str) -> dict | None:
+_USER_KEYS = [
+    'id', 'email', 'password', 'username', 'achievement', 'avatar',
+    'verified', 'verification_code', 'telegram', 'github', 'website', 'bio'
+]
+_USER_COLUMNS = ", ".join(_USER_KEYS)
+
+
+def _user_from_row(row) -> dict | None:
+    return dict(zip(_USER_KEYS, row)) if row else None
+
+
+# User records are loaded through load_user / load_user_async, keyed by id,
+# email, username or telegram. Within a request (see user_scope) each lookup
+# hits the database at most once; across requests the record is shared
+# through Redis under user:<field>:<value> for USER_CACHE_TTL seconds. A
+# record is cached only under its own exact values, so a lookup that matches
+# through the column collation (another letter case) always reads MySQL.
+# Every write to users drops the record's keys. The password hash and the
+# verification code never go to Redis: a lookup with credentials=True reads
+# them from MySQL, and only the request memo keeps them.
+USER_CACHE_TTL = 30
+_LOOKUPS = ('id', 'email', 'username', 'telegram')
+_CREDENTIALS = ('password', 'verification_code')
+_request_users: ContextVar[dict | None] = ContextVar("request_users", default=None)
+
+
+@contextmanager
+def user_scope():
+    """Memoize user lookups until the block exits, e.g. for one request"""
+    token = _request_users.set({})
+    try:
+        yield
+    finally:
+        _request_users.reset(token)
+
+
+def _cache_keys(user: dict) -> list[str]:
+    return [f"user:{field}:{user[field]}" for field in _LOOKUPS if user.get(field)]
+
+
+def _cache_record(user: dict) -> dict[str, dict]:
+    shared = {k: v for k, v in user.items() if k not in _CREDENTIALS}
+    return {key: shared for key in _cache_keys(user)}
+
+
+def _memoized(memo: dict | None, field: str, value, credentials: bool) -> tuple[bool, dict | None]:
+    if memo is None or (field, value) not in memo:
+        return False, None
+    user = memo[(field, value)]
+    if user is not None and credentials and 'password' not in user:
+        return False, None
+    return True, user
+
+
+def _forget() -> None:
+    memo = _request_users.get()
+    if memo is not None:
+        memo.clear()
+
+
+def _invalidate(*users: dict | None) -> None:
+    keys = [key for user in users if user for key in _cache_keys(user)]
+    if keys:
+        redis_client.delete(*keys)
+    _forget()
+
+
+def _select_user(field: str, value) -> dict | None:
     row = execute(
-        """
-        SELECT id, email, password, username, achievement, avatar, verified, verification_code,
-               telegram, github, website, bio
-        FROM users WHERE email = %s
-        """,
-        (email,), fetchone=True
+        f"SELECT {_USER_COLUMNS} FROM users WHERE {field} = %s",
+        (value,), fetchone=True
     )
-    if not row:
-        return None
-    keys = [
-        'id', 'email', 'password', 'username', 'achievement', 'avatar',
-        'verified', 'verification_code', 'telegram', 'github', 'website', 'bio'
-    ]
-    return dict(zip(keys, row))
+    return _user_from_row(row)
 
 
-def get_user_by_username(username: str) -> dict | None:
-    """
-    Возвращает пользователя по username или None.
+def load_user(field: str, value, credentials: bool = False) -> dict | None:
+    """Return the user whose field (id, email, username or telegram) equals value.
+
+    password and verification_code are included only with credentials=True.
     """
-    row = execute(
-        """
-        SELECT id, email, password, username, achievement, avatar, verified, verification_code,
-               telegram, github, website, bio
-        FROM users WHERE username = %s
-        """,
-        (username,), fetchone=True
-    )
-    if not row:
-        return None
-    keys = [
-        'id', 'email', 'password', 'username', 'achievement', 'avatar',
-        'verified', 'verification_code', 'telegram', 'github', 'website', 'bio'
-    ]
-    return dict(zip(keys, row))
-
-
-def save_user_test(user_id: int, test_type: str, section: str,
-                   passed: int, total: int, topics: list[int]) -> None:
-    """Save a test session for a user with type and section"""
+    if field not in _LOOKUPS:
+        raise ValueError(f"cannot look users up by {field}")
+    memo = _request_users.get()
+    found, user = _memoized(memo, field, value, credentials)
+    if found:
+        return user
+    key = f"user:{field}:{value}"
+    user = None if credentials else cache_get_many([key]).get(key)
+    if user is None:
+        user = _select_user(field, value)
+        if user:
+            cache_set_many(_cache_record(user), USER_CACHE_TTL)
+    if memo is not None:
+        memo[(field, value)] = user
+    return user
+
+
+async def load_user_async(field: str, value, credentials: bool = False) -> dict | None:
+    if field not in _LOOKUPS:
+        raise ValueError(f"cannot look users up by {field}")
+    memo = _request_users.get()
+    found, user = _memoized(memo, field, value, credentials)
+    if found:
+        return user
+    key = f"user:{field}:{value}"
+    user = None if credentials else (await acache_get_many([key])).get(key)
+    if user is None:
+        row = await aexecute(
+            f"SELECT {_USER_COLUMNS} FROM users WHERE {field} = %s",
+            (value,), fetchone=True
+        )
+        user = _user_from_row(row)
+        if user:
+            await acache_set_many(_cache_record(user), USER_CACHE_TTL)
+    if memo is not None:
+        memo[(field, value)] = user
+    return user
+
+
+def get_user_by_email(email: str, credentials: bool = False) -> dict | None:
+    return load_user("email", email, credentials)
+
+
+async def get_user_by_username_async(username: str) -> dict | None:
+    return await load_user_async("username", username)
+
+
+_INSERT_TEST = """
+    INSERT INTO tests(type, section, user_id, passed, total, average, earned_score, topics)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+async def save_user_test_async(user_id: int, test_type: str, section: str,
+                               passed: int, total: int, topics: list[int],
+                               db: AsyncSession = None) -> int:
+    if db is None:
+        async with atransaction() as db:
+            return await save_user_test_async(user_id, test_type, section, passed, total, topics, db)
     average = passed / total if total else 0
-    execute(
-        """
-        INSERT INTO tests(type, section, user_id, passed, total, average, earned_score, topics)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """,
+    test_id = await db.insert(
+        _INSERT_TEST,
         (test_type, section, user_id, passed,
          total, average, passed, json.dumps(topics))
     )
+    await db.execute(COUNT_TEST, (user_id,))
+    return test_id
 
 
-def get_user_tests(user_id: int) -> list[dict]:
-    """Retrieve all test sessions for a user, including topic codes"""
-    # Fetch all tests for user
-    rows = execute(
-        "SELECT id, type, section, passed, total, average, earned_score, topics, created_at"
-        " FROM tests WHERE user_id = %s ORDER BY created_at DESC",
-        (user_id,)
-    )
+_TESTS_QUERY = (
+    "SELECT id, type, section, passed, total, average, earned_score, topics, created_at"
+    " FROM tests WHERE user_id = %s ORDER BY created_at DESC"
+)
+
+
+def _parse_user_tests(rows) -> tuple[list[dict], set[int]]:
     tests = []
     all_topic_ids: set[int] = set()
     for test_id, test_type, sect, passed, total, average, earned_score, topics_json, created_at in rows:
@@ -150,17 +289,10 @@ def get_user_tests(user_id: int) -> list[dict]:
             "topic_ids": topic_ids,
             "created_at": created_at
         })
-    # Bulk fetch topic labels
-    if all_topic_ids:
-        placeholders = ",".join(["%s"] * len(all_topic_ids))
-        rows2 = execute(
-            f"SELECT id, label FROM topics WHERE id IN ({placeholders})",
-            tuple(all_topic_ids)
-        )
-        label_map = {r[0]: str(r[1]) for r in rows2}
-    else:
-        label_map = {}
-    # Build final result list
+    return tests, all_topic_ids
+
+
+def _label_user_tests(tests: list[dict], label_map: dict[int, str]) -> list[dict]:
     result = []
     for test in tests:
         topic_codes = [label_map.get(tid)
@@ -179,33 +311,49 @@ def get_user_tests(user_id: int) -> list[dict]:
     return result
 
 
-def get_user_scores(user_id: int) -> dict[str, int]:
-    fund_row = execute(
-        "SELECT score FROM fundamentals WHERE user_id = %s",
-        (user_id,), fetchone=True
-    )
-    fund_score = fund_row[0] if fund_row and fund_row[0] is not None else 0
-    alg_row = execute(
-        "SELECT score FROM algorithms WHERE user_id = %s",
-        (user_id,), fetchone=True
-    )
-    alg_score = alg_row[0] if alg_row and alg_row[0] is not None else 0
-    return {"fundamentals": fund_score, "algorithms": alg_score}
+def _overlay_pending(tests: list[dict], pending: dict[int, dict]) -> None:
+    """Fill in results of submitted tests the write-behind worker has not written yet"""
+    for test in tests:
+        submission = pending.get(test["id"])
+        if submission and not test["total"]:
+            for field in ("passed", "total", "average", "earned_score"):
+                test[field] = submission[field]
+
+
+async def get_user_tests_async(user_id: int) -> list[dict]:
+    pending = await get_pending(user_id)
+    async with asession() as db:
+        tests, all_topic_ids = _parse_user_tests(await db.execute(_TESTS_QUERY, (user_id,)))
+    _overlay_pending(tests, pending)
+    return _label_user_tests(tests, topic_label_map(all_topic_ids))
 
 
 def delete_user_by_id(user_id: int) -> bool:
     try:
-        execute("DELETE FROM user_achievements WHERE user_id = %s", (user_id,))
-        execute("DELETE FROM tests WHERE user_id = %s", (user_id,))
-        execute("DELETE FROM fundamentals WHERE user_id = %s", (user_id,))
-        execute("DELETE FROM algorithms WHERE user_id = %s", (user_id,))
-        execute("DELETE FROM users WHERE id = %s", (user_id,))
+        user = _select_user("id", user_id)
+        with transaction() as db:
+            db.execute("DELETE FROM user_achievements WHERE user_id = %s", (user_id,))
+            db.execute("DELETE FROM tests WHERE user_id = %s", (user_id,))
+            db.execute("DELETE FROM user_stats WHERE user_id = %s", (user_id,))
+            db.execute("DELETE FROM fundamentals WHERE user_id = %s", (user_id,))
+            db.execute("DELETE FROM algorithms WHERE user_id = %s", (user_id,))
+            db.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        _invalidate(user)
+        remove_user(user_id)
         return True
     except Exception as e:
         print(f"Error deleting user {user_id}: {e}")
         return False
 
 
+def set_password_hash(user_id: int, password_hash: str) -> None:
+    """Store an already hashed password, e.g. one rehashed on login"""
+    user = _select_user("id", user_id)
+    execute("UPDATE users SET password = %s WHERE id = %s",
+            (password_hash, user_id))
+    _invalidate(user)
+
+
 def set_refresh_token(user_id: int, refresh_token: str):
     execute("UPDATE users SET refresh_token = %s WHERE id = %s",
             (refresh_token, user_id))
@@ -213,53 +361,23 @@ def set_refresh_token(user_id: int, refresh_token: str):
 
 def get_user_by_refresh_token(refresh_token: str) -> dict | None:
     row = execute(
-        "SELECT id, email, password, username, achievement, avatar, "
-        "verified, verification_code, telegram, github, website, bio "
-        "FROM users WHERE refresh_token = %s",
+        f"SELECT {_USER_COLUMNS} FROM users WHERE refresh_token = %s",
         (refresh_token,), fetchone=True
     )
-    if not row:
-        return None
-    keys = [
-        'id', 'email', 'password', 'username', 'achievement', 'avatar',
-        'verified', 'verification_code', 'telegram', 'github', 'website', 'bio'
-    ]
-    return dict(zip(keys, row))
+    return _user_from_row(row)
 
 
 def get_user_by_id(user_id: int) -> dict | None:
     """Return user dict by user id or None"""
-    row = execute(
-        """
-        SELECT id, email, password, username, achievement, avatar, verified, verification_code,
-               telegram, github, website, bio
-        FROM users WHERE id = %s
-        """,
-        (user_id,), fetchone=True
-    )
-    if not row:
-        return None
-    keys = ['id', 'email', 'password', 'username', 'achievement', 'avatar',
-            'verified', 'verification_code', 'telegram', 'github', 'website', 'bio']
-    return dict(zip(keys, row))
+    return load_user("id", user_id)
+
+
+async def get_user_by_id_async(user_id: int) -> dict | None:
+    return await load_user_async("id", user_id)
 
 
 def get_user_by_telegram(telegram_username: str) -> dict | None:
     """
     Возвращает пользователя по Telegram-username или None.
     """
-    row = execute(
-        """
-        SELECT id, email, password, username, achievement, avatar, verified, verification_code,
-               telegram, github, website, bio
-        FROM users WHERE telegram = %s
-        """,
-        (telegram_username,), fetchone=True
-    )
-    if not row:
-        return None
-    keys = [
-        'id', 'email', 'password', 'username', 'achievement', 'avatar',
-        'verified', 'verification_code', 'telegram', 'github', 'website', 'bio'
-    ]
-    return dict(zip(keys, row))
+    return load_user("telegram", telegram_username)
@@ -0,0 +1,383 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+from pymysql.err import InterfaceError, OperationalError
+from redis.exceptions import ResponseError
+from database import atransaction, async_redis, redis_client, AsyncSession
+from services.cache_service import json_default
+from services.grading_service import compile_key
+from services.stats_service import ADD_RESULTS
+from services.test_session_service import pending_key
+
+# Write-behind queue for submitted tests. submit_test grades in memory and
+# appends one entry per submission to a Redis Stream; workers read it through
+# a consumer group and apply entries to MySQL in batches. Entries are acked
+# only after their transaction commits, and an entry left pending by a dead
+# worker is claimed by another after CLAIM_IDLE_MS, so every submission is
+# applied at least once. Applying is idempotent per test_id: a tests row with
+# a non-zero total has already been written and is skipped.
+# A batch that fails for a reason other than a lost or busy connection is
+# retried one entry at a time, so one bad entry does not hold back the rest.
+# An entry still failing on its MAX_DELIVERIES-th delivery is moved to the
+# DEAD_LETTER_KEY stream with the error and removed from the queue;
+# replay_dead_letters (manage.py replay-dead-letters) queues it again.
+# Until its rows are committed a submission is also listed under
+# test_session_service.pending_key, so reads can show it right away.
+# A submission graded against an answer key that has changed since (the test
+# was open during the edit) is written as graded, and its question is added
+# to STALE_KEY; regrade_service reschedules those questions' jobs.
+# paused_writes holds every worker off MySQL, e.g. while the leaderboard is
+# rebuilt from it: a worker takes a mark under APPLYING_PREFIX for each batch
+# unless PAUSE_KEY is set, and pausing waits until no mark is left.
+STREAM_KEY = "writes:submissions"
+DEAD_LETTER_KEY = "writes:submissions:dead"
+GROUP = "writers"
+BATCH_SIZE = 200
+BLOCK_MS = 1000
+CLAIM_IDLE_MS = 60_000
+MAX_DELIVERIES = 5
+STALE_KEY = "regrade:stale"
+PAUSE_KEY = "writes:paused"
+APPLYING_PREFIX = "writes:applying:"
+PAUSE_TTL = 300
+MOSCOW_TZ = datetime.timezone(datetime.timedelta(hours=3))
+
+logger = logging.getLogger(__name__)
+
+_INSERT_ANSWER = (
+    "INSERT INTO test_answers (test_id, question_id, user_answer, correct_answer, is_correct) "
+    "VALUES (%s, %s, %s, %s, %s)"
+)
+
+_BEGIN_SCRIPT = async_redis.register_script(
+    """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return 0
+    end
+    redis.call('SET', KEYS[2], 1, 'PX', ARGV[1])
+    return 1
+    """
+)
+
+
+def consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def enqueue_submission(submission: dict, ranking: str) -> None:
+    """Queue a graded submission for writing to MySQL.
+
+    submission holds test_id, user_id, section, passed, total, average,
+    earned_score, submitted_at (a unix timestamp) and answers, a list of
+    (question_id, user_answer, correct_answer, is_correct). earned_score is
+    added to the ranking sorted set in the same MULTI, so a leaderboard
+    rebuild finds it either in the stream or in MySQL.
+    """
+    data = json.dumps(submission, default=json_default)
+    pipe = async_redis.pipeline()
+    pipe.xadd(STREAM_KEY, {"data": data})
+    pipe.hset(pending_key(submission["user_id"]), submission["test_id"], data)
+    if submission["earned_score"]:
+        pipe.zincrby(ranking, submission["earned_score"], str(submission["user_id"]))
+    await pipe.execute()
+
+
+@contextmanager
+def paused_writes():
+    """Stop the workers from writing to MySQL for the duration of the block.
+
+    Returns once no batch is being applied. The pause lapses after PAUSE_TTL
+    unless extend_pause is called, so a crashed caller cannot stall writes.
+    """
+    redis_client.set(PAUSE_KEY, 1, ex=PAUSE_TTL)
+    try:
+        # marks expire after CLAIM_IDLE_MS, so this ends even if a worker died
+        while next(redis_client.scan_iter(match=APPLYING_PREFIX + "*"), None):
+            time.sleep(0.05)
+        yield
+    finally:
+        redis_client.delete(PAUSE_KEY)
+
+
+def extend_pause() -> None:
+    redis_client.expire(PAUSE_KEY, PAUSE_TTL)
+
+
+async def _begin(consumer: str) -> bool:
+    """Take the consumer's applying mark; False while writes are paused"""
+    return bool(await _BEGIN_SCRIPT(keys=[PAUSE_KEY, APPLYING_PREFIX + consumer], args=[CLAIM_IDLE_MS]))
+
+
+async def _end(consumer: str) -> None:
+    await async_redis.delete(APPLYING_PREFIX + consumer)
+
+
+async def _ensure_group() -> None:
+    try:
+        await async_redis.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def _write(db: AsyncSession, submissions: list[dict]) -> None:
+    """Write the submissions whose tests are not written yet"""
+    by_test = {s["test_id"]: s for s in submissions}
+    placeholders = ",".join(["%s"] * len(by_test))
+    rows = await db.execute(
+        f"SELECT id FROM tests WHERE id IN ({placeholders}) AND total = 0 FOR UPDATE",
+        tuple(by_test)
+    )
+    pending = [by_test[r[0]] for r in rows]
+    if not pending:
+        return
+    await db.executemany(
+        "UPDATE tests SET passed = %s, total = %s, average = %s, earned_score = %s, "
+        "end_time = %s WHERE id = %s",
+        [(s["passed"], s["total"], s["average"], s["earned_score"],
+          datetime.datetime.fromtimestamp(s["submitted_at"], MOSCOW_TZ), s["test_id"])
+         for s in pending]
+    )
+    # one row update per user and section, however many tests they submitted
+    totals: dict[tuple[str, int], list] = {}
+    for s in pending:
+        table = 'fundamentals' if s["section"] == 'fundamentals' else 'algorithms'
+        acc = totals.setdefault((table, s["user_id"]), [0, 0, 0, s["submitted_at"]])
+        acc[0] += s["earned_score"]
+        acc[1] += s["passed"]
+        acc[2] += s["total"]
+        acc[3] = max(acc[3], s["submitted_at"])
+    for table in ('fundamentals', 'algorithms'):
+        params = [
+            (score, passed, total, datetime.datetime.fromtimestamp(last, datetime.timezone.utc), user_id)
+            for (t, user_id), (score, passed, total, last) in totals.items() if t == table
+        ]
+        if params:
+            await db.executemany(
+                f"UPDATE {table} SET score = score + %s, "
+                f"testsPassed = testsPassed + %s, "
+                f"totalTests = totalTests + %s, "
+                f"lastActivity = %s WHERE user_id = %s",
+                params
+            )
+    stats: dict[int, list] = {}
+    for s in pending:
+        acc = stats.setdefault(s["user_id"], [0, 0, 0.0])
+        acc[0] += s["passed"]
+        acc[1] += s["total"]
+        acc[2] += s["average"]
+    await db.executemany(
+        ADD_RESULTS, [(user_id, *acc) for user_id, acc in stats.items()])
+    await db.executemany(
+        _INSERT_ANSWER,
+        [(s["test_id"], qid, json.dumps(user_answer, ensure_ascii=False),
+          json.dumps(correct, ensure_ascii=False), is_correct)
+         for s in pending for qid, user_answer, correct, is_correct in s["answers"]]
+    )
+
+
+async def _stale_questions(db: AsyncSession, submissions: list[dict]) -> set[int]:
+    """Return the questions whose key changed after the submissions were graded"""
+    graded: dict[int, list] = {}
+    for s in submissions:
+        for qid, _, correct, _ in s["answers"]:
+            graded.setdefault(qid, []).append(correct)
+    if not graded:
+        return set()
+    placeholders = ",".join(["%s"] * len(graded))
+    rows = await db.execute(
+        f"SELECT id, question_type, correct_answer FROM current_questions WHERE id IN ({placeholders})",
+        tuple(graded)
+    )
+    stale = set()
+    for qid, qtype, correct_json in rows:
+        correct = json.loads(correct_json) if correct_json else []
+        if isinstance(correct, str):
+            correct = json.loads(correct)
+        key = compile_key(qtype, correct)
+        if any(compile_key(qtype, old) != key for old in graded[qid]):
+            stale.add(qid)
+    return stale
+
+
+async def _apply(submissions: list[dict]) -> None:
+    if not submissions:
+        return
+    async with atransaction() as db:
+        # checked on every delivery, so a failed SADD is retried with the entry
+        stale = await _stale_questions(db, submissions)
+        await _write(db, submissions)
+    if stale:
+        await async_redis.sadd(STALE_KEY, *stale)
+
+
+def _transient(error: Exception) -> bool:
+    """Whether an error says nothing about the entries, e.g. MySQL is unreachable"""
+    return isinstance(error, (OperationalError, InterfaceError, ConnectionError, asyncio.TimeoutError))
+
+
+async def _ack(ids: list, written: list[dict]) -> None:
+    """Remove settled entries from the stream and written ones from the pending lists"""
+    if not ids:
+        return
+    pipe = async_redis.pipeline()
+    pipe.xack(STREAM_KEY, GROUP, *ids)
+    pipe.xdel(STREAM_KEY, *ids)
+    for s in written:
+        pipe.hdel(pending_key(s["user_id"]), s["test_id"])
+    await pipe.execute()
+
+
+async def _dead_letter(entry_id: bytes, fields: dict, error: Exception) -> bool:
+    """Move a failing entry to the dead-letter stream once it has used up its
+    deliveries; return whether it was moved"""
+    pending = await async_redis.xpending_range(
+        STREAM_KEY, GROUP, min=entry_id, max=entry_id, count=1)
+    deliveries = pending[0]["times_delivered"] if pending else MAX_DELIVERIES
+    if deliveries < MAX_DELIVERIES:
+        logger.warning("Submission %s failed on delivery %d of %d: %r",
+                       entry_id.decode(), deliveries, MAX_DELIVERIES, error)
+        return False
+    await async_redis.xadd(DEAD_LETTER_KEY, {**fields, b"entry_id": entry_id, b"error": repr(error)})
+    logger.error("Submission %s moved to %s after %d deliveries: %r",
+                 entry_id.decode(), DEAD_LETTER_KEY, deliveries, error)
+    return True
+
+
+async def _process_each(entries) -> int:
+    applied = []
+    settled = []
+    try:
+        for entry_id, fields in entries:
+            try:
+                if fields:
+                    submission = json.loads(fields[b"data"])
+                    await _apply([submission])
+                    applied.append(submission)
+                settled.append(entry_id)
+            except Exception as e:
+                if _transient(e):
+                    raise
+                if await _dead_letter(entry_id, fields, e):
+                    settled.append(entry_id)
+    finally:
+        await _ack(settled, applied)
+    return len(applied)
+
+
+async def _process(entries) -> int:
+    """Apply entries, acking every one that was written or dead-lettered.
+
+    Returns the number written. Failed entries stay pending and are claimed
+    again after CLAIM_IDLE_MS.
+    """
+    if not entries:
+        return 0
+    submissions = [json.loads(fields[b"data"]) for _, fields in entries if fields]
+    try:
+        await _apply(submissions)
+    except Exception as e:
+        if _transient(e):
+            raise
+        logger.warning("Write-behind batch of %d failed, applying entries one at a time: %r",
+                       len(entries), e)
+        return await _process_each(entries)
+    await _ack([entry_id for entry_id, _ in entries], submissions)
+    return len(submissions)
+
+
+async def _claim(consumer: str, min_idle_ms: int) -> list:
+    _, entries, *_ = await async_redis.xautoclaim(
+        STREAM_KEY, GROUP, consumer, min_idle_ms, start_id="0-0", count=BATCH_SIZE)
+    return entries
+
+
+async def _read(consumer: str, block_ms: int | None, start: str = ">") -> list:
+    """Read new entries, or with start="0" the ones already delivered to consumer"""
+    reply = await async_redis.xreadgroup(
+        GROUP, consumer, {STREAM_KEY: start}, count=BATCH_SIZE, block=block_ms)
+    return reply[0][1] if reply else []
+
+
+async def run_worker(consumer: str | None = None) -> None:
+    """Apply queued submissions until cancelled"""
+    consumer = consumer or consumer_name()
+    await _ensure_group()
+    while True:
+        try:
+            if not await _begin(consumer):
+                await asyncio.sleep(BLOCK_MS / 1000)
+                continue
+            try:
+                entries = await _claim(consumer, CLAIM_IDLE_MS) or await _read(consumer, BLOCK_MS)
+                await _process(entries)
+            finally:
+                await _end(consumer)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Write-behind batch failed, will retry")
+            await asyncio.sleep(1)
+
+
+async def drain(consumer: str | None = None) -> int:
+    """Apply every queued submission, including ones left pending by dead workers.
+
+    Entries pending on another consumer are taken only once idle for
+    CLAIM_IDLE_MS, so a live worker is not raced mid-apply. An entry that
+    keeps failing is retried until it is dead-lettered; a transient error
+    is raised. Waits while writes are paused.
+    """
+    consumer = consumer or consumer_name()
+    await _ensure_group()
+    applied = 0
+    while True:
+        if not await _begin(consumer):
+            await asyncio.sleep(BLOCK_MS / 1000)
+            continue
+        try:
+            entries = (await _claim(consumer, CLAIM_IDLE_MS)
+                       or await _read(consumer, None, "0")
+                       or await _read(consumer, None))
+            if not entries:
+                return applied
+            applied += await _process(entries)
+        finally:
+            await _end(consumer)
+
+
+async def list_dead_letters(count: int = BATCH_SIZE) -> list[tuple[str, dict, str]]:
+    """Return up to count dead-lettered entries as (id, submission, error), oldest first"""
+    entries = await async_redis.xrange(DEAD_LETTER_KEY, count=count)
+    return [(entry_id.decode(), json.loads(fields[b"data"]), fields.get(b"error", b"").decode())
+            for entry_id, fields in entries]
+
+
+async def replay_dead_letters(ids: list[str] | None = None) -> int:
+    """Queue dead-lettered submissions again, all of them or the given ids.
+
+    Each entry is moved back to the stream in one MULTI with its removal from
+    DEAD_LETTER_KEY. Returns the number queued.
+    """
+    replayed = 0
+    start = "-"
+    while True:
+        entries = await async_redis.xrange(DEAD_LETTER_KEY, min=start, count=BATCH_SIZE)
+        if not entries:
+            return replayed
+        start = "(" + entries[-1][0].decode()
+        selected = [(entry_id, fields) for entry_id, fields in entries
+                    if ids is None or entry_id.decode() in ids]
+        if not selected:
+            continue
+        pipe = async_redis.pipeline()
+        for entry_id, fields in selected:
+            pipe.xadd(STREAM_KEY, {"data": fields[b"data"]})
+            pipe.xdel(DEAD_LETTER_KEY, entry_id)
+        await pipe.execute()
+        replayed += len(selected)